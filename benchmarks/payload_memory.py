@@ -0,0 +1,71 @@
+"""
+Peak memory of building a popup payload for 1, 10 and 50 MB images.
+
+Each case runs in a fresh interpreter so its peak RSS isn't hidden by a previous one.
+
+    python benchmarks/payload_memory.py
+"""
+import base64
+import os
+import os.path as osp
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from utils.payload import encode_file  # noqa: E402
+
+SIZES = (1, 10, 50)
+HEAD = '<img style="width: 100px;height: 100px;" src="data:image/png;base64,'
+TAIL = '"><div>100x100 %s</div>'
+
+
+def max_rss() -> int:
+    """Return the peak RSS of this process in bytes."""
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def whole(path: str) -> str:
+    """The way `handle_as_url` built the payload before `encode_file`."""
+
+    with open(path, "rb") as img:
+        content = img.read()
+    encoded = str(base64.b64encode(content), "utf-8")
+    return (HEAD + "%s" + TAIL) % (encoded, "1KB")
+
+
+def chunked(path: str) -> str:
+    return encode_file(path, HEAD, TAIL % "1KB")
+
+
+def run(method: str, path: str):
+    before = max_rss()
+    html = globals()[method](path)
+    print(max_rss() - before, len(html))
+
+
+def main():
+    print("%6s %12s %12s" % ("size", "whole", "chunked"))
+    for size in SIZES:
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(os.urandom(size << 20))
+        try:
+            peaks = []
+            for method in ("whole", "chunked"):
+                out = subprocess.check_output([sys.executable, __file__, method, f.name])
+                peaks.append(int(out.split()[0]) >> 20)
+            print("%4dMB %10dMB %10dMB" % (size, peaks[0], peaks[1]))
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run(*sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,73 @@
+"""
+Time spent importing the plugin and running `plugin_loaded()`.
+
+It needs the `sublime` module so it runs in Sublime Text's console:
+
+    import runpy; runpy.run_path(sublime.packages_path() + "/ImagePreview/benchmarks/startup.py")
+
+It fails if loading the plugin takes longer than `BUDGET` or imports one
+of the modules that must only be loaded when an image is previewed.
+"""
+import importlib
+import inspect
+import os.path as osp
+import sys
+import time
+
+PACKAGE = osp.basename(osp.dirname(osp.dirname(osp.abspath(__file__))))
+ROUNDS = 20
+# in milliseconds
+BUDGET = 5
+LAZY = {"urllib.request", "subprocess", "shutil", "hashlib", "tempfile", "concurrent.futures",
+        "unittest", "json", "mmap", "zipfile", "cProfile", "pstats"}
+
+
+def package_modules():
+    return {name: module for name, module in sys.modules.items()
+            if name == PACKAGE or name.startswith(PACKAGE + ".")}
+
+
+def load():
+    """Import a fresh copy of the plugin and load it, return it and the time it took."""
+
+    for name in package_modules():
+        del sys.modules[name]
+    start = time.perf_counter()
+    main = importlib.import_module(PACKAGE + ".main")
+    main.plugin_loaded()
+    return main, (time.perf_counter() - start) * 1000
+
+
+def eager_imports():
+    """Return the lazy modules bound at module level by the plugin and its utils."""
+
+    return sorted({value.__name__ for module in package_modules().values() for value in vars(module).values()
+                   if inspect.ismodule(value) and value.__name__ in LAZY})
+
+
+def main():
+    live = package_modules()
+    try:
+        timings = []
+        for _ in range(ROUNDS):
+            plugin, elapsed = load()
+            timings.append(elapsed)
+        eager = eager_imports()
+        compiled = sorted(plugin.compiled_patterns)
+    finally:
+        # put the running plugin back and let it register its settings listener again
+        for name in package_modules():
+            del sys.modules[name]
+        sys.modules.update(live)
+        if PACKAGE + ".main" in live:
+            live[PACKAGE + ".main"].plugin_loaded()
+
+    timings.sort()
+    print("[ImagePreview] import + plugin_loaded(): min %.2fms, median %.2fms, max %.2fms" %
+          (timings[0], timings[len(timings) // 2], timings[-1]))
+    assert timings[len(timings) // 2] < BUDGET, "loading the plugin takes more than %dms" % BUDGET
+    assert not eager, "imported at load time: %s" % ", ".join(eager)
+    assert not compiled, "compiled at load time: %s" % ", ".join(compiled)
+
+
+main()
@@ -1,76 +1,160 @@
+# Only what's needed to load the plugin is imported here, the network,
+# conversion and saving code imports its modules on first use.
 import base64
-import hashlib
 import os
 import os.path as osp
 import re
-import shutil
-import subprocess
-import tempfile
+import threading
 
-from urllib.parse import quote, unquote
-from urllib.request import urlopen
+from bisect import bisect
+from collections import OrderedDict
 try:
-    from typing import List, Optional, Tuple
-    assert List and Optional and Tuple
+    from typing import TYPE_CHECKING, Callable, Dict, List, Match, Optional, Pattern, Set, Tuple
+    assert Callable and Dict and List and Match and Optional and Pattern and Set and Tuple
 except ImportError:
-    pass
+    TYPE_CHECKING = False
 
 import sublime  # type: ignore
 import sublime_plugin  # type: ignore
 
 from .utils.get_image_size import get_image_size, UnknownImageFormat  # type: ignore
+from .utils.payload import encode_file  # type: ignore
 from .utils.settings import Settings  # type: ignore
 
+if TYPE_CHECKING:
+    from .utils.archive import Archives  # noqa: F401
+    from .utils.resolver import AssetResolver  # noqa: F401
+    from .utils.thumbnail_pack import Entry, ThumbnailPack  # noqa: F401
+    from concurrent.futures import Executor  # noqa: F401
 
-TEMPLATE = """
-    <img style="width: %dpx;height: %dpx;" src="data:image/%s;base64,%s">
+
+TEMPLATE_HEAD = """
+    <img style="width: %dpx;height: %dpx;" src="data:image/%s;base64,"""
+TEMPLATE_TAIL = """">
     <div>%dx%d %s</div>
     <div>
         <a href="open">Open</a> | <a href="save">Save</a> | <a href="save_as">Save as</a>
     </div>
     """
-TEMP_DIR = tempfile.gettempdir()
-IMAGE_DATA_URL_RE = re.compile(r"data:image/(jpeg|png|gif|bmp|svg\+xml);base64,([a-zA-Z0-9+/ ]+={0,2})")
-image_url_re = re.compile("")
-image_file_re = re.compile("")
-image_file_name_re = re.compile("")
+TEMPLATE = TEMPLATE_HEAD + "%s" + TEMPLATE_TAIL
+DIMENSIONS_TEMPLATE = """
+    <div>%dx%d %s (%s)</div>
+    <div>
+        <a href="open">Open</a> | <a href="save">Save</a> | <a href="save_as">Save as</a>
+    </div>
+    """
+INLINE_TEMPLATE = '<img style="width: %dpx;height: %dpx;" src="data:image/%s;base64,%s">'
+LOADING_TEMPLATE = """
+    <div>Loading %s...</div>
+    """
+IMAGE_DATA_URL_PATTERN = r"data:image/(jpeg|png|gif|bmp|svg\+xml);base64,([a-zA-Z0-9+/ ]+={0,2})"
+# %s is replaced by the supported extensions
+PATTERNS = {
+    "url": (r"(?:(https?)://)?"                         # http(s)://
+            r"(?:[^./\"'\s]+\.){1,3}[^/\"'.\s]+/"       # host
+            r"(?:[^/\"'\s]+/)*"                         # path
+            r"([^\"'/\s]+?\.(?:%s))([\?][^)\" \"]*)?"),  # name
+    "file": (r"(?:"                                     # drive
+             r"\w:\\|"                                  # Windows (e.g C:\)
+             r"\\\\|"                                   # Linux (\\)
+             r"/|"                                      # base /
+             r"~[\\/]|"                                 # home or alias (e.g ~/)
+             r"(?:\.{1,2}[\\/])?"                       # Mac OS and/or relative
+             r")"
+             r"(?:[-.@\w]+?[\\/])*"                     # body
+             r"[-.@\w]+?"                               # name
+             r"\.(?:%s)"),                              # extension
+    "name": (r"[-.@\w]+"                                # name
+             r"\.(?:%s)"),                              # extension
+}
+# the kinds of image references, in the order they are looked for
+KINDS = ("url", "data_url", "file", "name")
+compiled_patterns = {}  # type: Dict[str, Pattern]
+temp_dir = None  # type: Optional[str]
 all_formats = []  # type: List[str]
 formats_to_convert = ()  # type: Tuple[str, ...]
+thumbnail_pack = None  # type: Optional[ThumbnailPack]
+# makes the thumbnails in the background, apart from the previews
+packer = None  # type: Optional[Executor]
+# (file, stamp, size, shrink) of the thumbnails waiting for the packer
+queued = set()  # type: Set[tuple]
+queued_lock = threading.Lock()
+archives = None  # type: Optional[Archives]
+# url -> time its image was downloaded in the temporary folder
+downloaded = {}  # type: Dict[str, float]
+# view id -> its latest hover, the older ones are superseded
+hovers = {}  # type: Dict[int, Hover]
+# (file, stamp) -> (first frame or the file itself, number of frames)
+posters = {}  # type: Dict[Tuple[str, str], Tuple[str, int]]
+# (project folders, asset roots, aliases) -> resolver
+resolvers = {}  # type: Dict[tuple, AssetResolver]
+# (project folders, archive path as written) -> archive file
+archive_paths = {}  # type: Dict[Tuple[tuple, str], str]
+# incremented whenever the settings change, to drop what was computed from them
+settings_version = 0
 
 
 def on_change(s):
     global all_formats,\
         formats_to_convert,\
-        image_url_re,\
-        image_file_re,\
-        image_file_name_re
+        settings_version
 
     Settings.update(s)
+    settings_version += 1
     # ST popups supported formats
     ST_FORMATS = {"png", "jpg", "jpeg", "bmp", "gif"}
     unique_formats_to_convert = set(Settings.formats_to_convert)
     all_formats = list(ST_FORMATS.union(unique_formats_to_convert))
     # filter out ST supported formats
     formats_to_convert = tuple('.' + ext for ext in unique_formats_to_convert - ST_FORMATS)
-    formats_ored = '|'.join(all_formats)
-    image_url_re = re.compile(r"(?:(https?)://)?"                       # http(s)://
-                              r"(?:[^./\"'\s]+\.){1,3}[^/\"'.\s]+/"     # host
-                              r"(?:[^/\"'\s]+/)*"                       # path
-                              r"([^\"'/\s]+?\.(?:%s))([\?][^)\" \"]*)?" % formats_ored)  # name
-
-    image_file_re = re.compile(r"(?:"                                   # drive
-                               r"\w:\\|"                                # Windows (e.g C:\)
-                               r"\\\\|"                                 # Linux (\\)
-                               r"/|"                                    # base /
-                               r"(?:\.{1,2}[\\/])?"                     # Mac OS and/or relative
-                               r")"
-                               r"(?:[-.@\w]+?[\\/])*"                   # body
-                               r"[-.@\w]+?"                             # name
-                               r"\.(?:%s)" % formats_ored               # extension
-                               )
-    image_file_name_re = re.compile(r"[-.@\w]+"                         # name
-                                    r"\.(?:%s)" % formats_ored          # extension
-                                    )
+    # the patterns depend on the formats, compile them again when they are needed
+    compiled_patterns.clear()
+    resolvers.clear()
+    archive_paths.clear()
+    sublime.set_timeout(toggle_inline_thumbnails, 0)
+
+
+def toggle_inline_thumbnails():
+    """Show the inline thumbnails of the active view or remove them all, following the settings."""
+
+    for window in sublime.windows():
+        for view in window.views():
+            listener = sublime_plugin.find_view_event_listener(view, InlineThumbnails)
+            if not listener:
+                continue
+            if Settings.inline_thumbnails and view == window.active_view():
+                listener.on_activated()
+            elif listener.shown:
+                listener.schedule(0)
+
+
+def pattern(kind: str) -> 'Pattern':
+    """Return the regex matching the image references of the given `kind`, compiled on first use."""
+
+    regex = compiled_patterns.get(kind)
+    if regex is None:
+        if kind == "data_url":
+            regex = re.compile(IMAGE_DATA_URL_PATTERN)
+        else:
+            regex = re.compile(PATTERNS[kind] % '|'.join(all_formats))
+        compiled_patterns[kind] = regex
+    return regex
+
+
+def get_temp_dir() -> str:
+    global temp_dir
+
+    if temp_dir is None:
+        import tempfile
+        temp_dir = tempfile.gettempdir()
+    return temp_dir
+
+
+def temp_path(prefix: str, key: str, ext: str) -> str:
+    """Return a temporary file of its own for `key`, so that concurrent previews don't share one."""
+
+    import hashlib
+    return osp.join(get_temp_dir(), prefix + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12] + ext)
 
 
 def plugin_loaded():
@@ -80,20 +164,24 @@ def plugin_loaded():
     loaded_settings.add_on_change("image_preview", lambda ls=loaded_settings: on_change(ls))
 
 
-def magick(inp, out):
-    """Convert the image from one format to another."""
+def plugin_unloaded():
+    if packer:
+        packer.shutdown(wait=False)
+    if thumbnail_pack:
+        thumbnail_pack.close()
+    if archives:
+        archives.close()
 
-    subprocess.call(["magick", inp, out], shell=os.name == "nt")
 
+def magick(inp, out, *options):
+    """Convert the image from one format to another."""
 
-def get_data(view: sublime.View, path: str) -> 'Tuple[int, int, int, int, int]':
-    """
-    Return a tuple of (width, height, real_width, real_height, size).
+    import subprocess
+    subprocess.call(["magick", inp] + list(options) + [out], shell=os.name == "nt")
 
-    `real_width` and `real_height` are the real dimensions of the image file
-    `width` and `height` are adjusted to the viewport
-    `size` is the size of the image file
-    """
+
+def fit_to_viewport(view: sublime.View, real_width: int, real_height: int) -> 'Tuple[float, float]':
+    """Return the dimensions of a `real_width`x`real_height` image adjusted to the viewport."""
 
     # set max dimensions to 75% of the viewport
     max_width, max_height = view.viewport_extent()
@@ -101,11 +189,6 @@ def get_data(view: sublime.View, path: str) -> 'Tuple[int, int, int, int, int]':
     max_height *= 0.75
     max_ratio = max_height / max_width
 
-    try:
-        real_width, real_height, size = get_image_size(path)
-    except UnknownImageFormat:
-        return -1, -1, -1, -1, -1
-
     # First check height since it's the smallest vector
     if real_height / real_width >= max_ratio and real_height > max_height:
         width = real_width * max_height / real_height
@@ -117,9 +200,254 @@ def get_data(view: sublime.View, path: str) -> 'Tuple[int, int, int, int, int]':
         width = real_width
         height = real_height
 
+    return width, height
+
+
+def get_data(view: sublime.View, path: str) -> 'Tuple[int, int, int, int, int]':
+    """
+    Return a tuple of (width, height, real_width, real_height, size).
+
+    `real_width` and `real_height` are the real dimensions of the image file
+    `width` and `height` are adjusted to the viewport
+    `size` is the size of the image file
+    """
+
+    try:
+        real_width, real_height, size = get_image_size(path)
+    except UnknownImageFormat:
+        return -1, -1, -1, -1, -1
+
+    width, height = fit_to_viewport(view, real_width, real_height)
+
     return width, height, real_width, real_height, size
 
 
+def human_size(size: int, frames=1) -> str:
+    size_str = str(size // 1024) + "KB" if size >= 1024 else str(size) + 'B'
+    return size_str + (", %d frames" % frames if frames > 1 else "")
+
+
+def too_large(size: int) -> bool:
+    """Whether an image of `size` bytes is too large to be embedded in a popup."""
+
+    return size > Settings.max_preview_size * 1024 * 1024
+
+
+def file_popup(view: sublime.View, file: str, ext: str, source_size=None, frames=1) -> str:
+    """
+    Return the popup content for `file`, without embedding the image if it's too large.
+
+    `source_size` and `frames` describe the animation `file` is the first frame of.
+    """
+
+    width, height, real_width, real_height, size = get_data(view, file)
+    caption = (real_width, real_height, human_size(size if source_size is None else source_size, frames))
+    if too_large(size):
+        return DIMENSIONS_TEMPLATE % (caption + ("too large to preview",))
+    return encode_file(file, TEMPLATE_HEAD % (width, height, ext), TEMPLATE_TAIL % caption)
+
+
+def get_archives() -> 'Archives':
+    """Return the cache of open archives, creating it on first use."""
+
+    global archives
+
+    if archives is None:
+        from .utils.archive import Archives  # type: ignore
+        archives = Archives()
+    return archives
+
+
+def poster_frame(file: str) -> 'Tuple[str, int]':
+    """
+    Return the file to render for the image at `file` and its number of frames.
+
+    Animated images are rendered from a still copy of their first frame,
+    extracted once per version of the file.
+    """
+
+    import hashlib
+    from .utils.animation import extract_first_frame, frame_count  # type: ignore
+    from .utils.thumbnail_pack import file_stamp  # type: ignore
+
+    key = file, file_stamp(file)
+    if key not in posters:
+        poster = file
+        try:
+            frames = frame_count(file)
+            if frames > 1:
+                digest = hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()[:12]
+                poster = osp.join(get_temp_dir(), "poster_" + digest + osp.splitext(file)[1])
+                if not extract_first_frame(file, poster):
+                    poster = file
+        # a file that can't be parsed is previewed as is
+        except Exception as e:
+            print("[ImagePreview] can't read the frames of %s: %s" % (file, e))
+            frames = 1
+        posters[key] = poster, frames
+    return posters[key]
+
+
+def converted_png(file: str, image: str) -> str:
+    """Return a png copy of `image` (`file` or its first frame), converted once per version of `file`."""
+
+    from .utils.thumbnail_pack import file_stamp  # type: ignore
+
+    png = temp_path("converted_", file + "|" + file_stamp(file), ".png")
+    if not osp.exists(png):
+        # readers never see a partly written file
+        part = png[:-len(".png")] + ".part.png"
+        magick(image, part)
+        if osp.exists(part):
+            os.replace(part, png)
+    return png
+
+
+def get_thumbnail_pack() -> 'Optional[ThumbnailPack]':
+    """Return the thumbnail pack, opening it on first use."""
+
+    global thumbnail_pack
+
+    if not Settings.thumbnail_pack:
+        return None
+    if thumbnail_pack is None:
+        from .utils.thumbnail_pack import ThumbnailPack  # type: ignore
+        thumbnail_pack = ThumbnailPack(osp.join(sublime.cache_path(), "ImagePreview"),
+                                       max_size=Settings.max_thumbnail_pack_size * 1024 * 1024)
+    return thumbnail_pack
+
+
+def get_packer() -> 'Executor':
+    """Return the single thread making the thumbnails, so that the previews don't wait for it."""
+
+    global packer
+
+    with queued_lock:
+        if packer is None:
+            from concurrent.futures import ThreadPoolExecutor
+            packer = ThreadPoolExecutor(max_workers=1)
+    return packer
+
+
+def queue_thumbnail(pack: 'ThumbnailPack', source: str, stamp: str, size: int, image=None, frames=1,
+                    shrink=False):
+    """Make the thumbnail of `source` on the packer, see `pack_thumbnails`."""
+
+    key = source, stamp, size, shrink
+    with queued_lock:
+        if key in queued:
+            return
+        queued.add(key)
+
+    def run():
+        try:
+            pack_thumbnails(pack, source, stamp, size, image, frames, shrink)
+        except Exception as e:
+            print("[ImagePreview] can't make the thumbnail of %s: %s" % (source, e))
+        finally:
+            with queued_lock:
+                queued.discard(key)
+
+    get_packer().submit(run)
+
+
+def get_profiles_dir() -> str:
+    """Return the folder where the profiles of slow previews are kept."""
+
+    return osp.join(sublime.cache_path(), "ImagePreview", "profiles")
+
+
+def find_thumbnail(view: sublime.View, pack: 'ThumbnailPack', file: str, stamp: str,
+                   fit=True) -> 'Optional[Entry]':
+    """
+    Return the smallest packed thumbnail of `file` that fills the popup.
+
+    With `fit=False` return the largest one instead, even if it doesn't fill the popup.
+    """
+
+    largest = None
+    for entry in pack.entries(file, stamp):
+        if too_large(entry.length * 3 // 4):
+            break
+        largest = entry
+        width, height = fit_to_viewport(view, entry.real_width, entry.real_height)
+        if fit and (entry.full or max(entry.width, entry.height) >= max(width, height)):
+            return entry
+    return None if fit else largest
+
+
+def thumbnail_popup(view: sublime.View, pack: 'ThumbnailPack', entry: 'Entry') -> 'Optional[str]':
+    """Return the popup content for a packed thumbnail, scaled as the image itself would be."""
+
+    encoded = pack.read(entry)
+    if encoded is None:
+        return None
+    width, height = fit_to_viewport(view, entry.real_width, entry.real_height)
+    return TEMPLATE % (width, height, entry.fmt, encoded, entry.real_width, entry.real_height,
+                       human_size(entry.file_size, entry.frames))
+
+
+def pack_thumbnails(pack: 'ThumbnailPack', source: str, stamp: str, size: int, image=None, frames=1,
+                    shrink=False):
+    """
+    Append the thumbnail of `source` filling `size` pixels to the pack, unless it's already there.
+
+    `image` is the file rendered in the popup, either `source` itself, its
+    converted copy or the first of its `frames`, it's made again if not given.
+    Imagemagick only shrinks the images that can't be shown as they are
+    (converted or too large ones), or all of them with `shrink`. Only small
+    images are packed as they are, the others are made into a PNG of the
+    level, which is skipped if it's still too heavy.
+    """
+
+    from .utils.thumbnail_pack import LEVELS, MAX_ENTRY_SIZE  # type: ignore
+
+    # the smallest level filling `size`
+    level = next((level for level in LEVELS if level >= size), LEVELS[-1])
+    for entry in pack.entries(source, stamp):
+        # big enough, and small enough when shrinking
+        if (entry.full or entry.level >= level) and not (shrink and max(entry.width, entry.height) > level):
+            return
+
+    if image is None:
+        image, frames = poster_frame(source)
+        if source.endswith(formats_to_convert):
+            image = converted_png(source, image)
+    try:
+        real_width, real_height, file_size = get_image_size(image)
+        if frames > 1:
+            file_size = osp.getsize(source)
+    except (OSError, UnknownImageFormat):
+        return
+
+    needs_magick = shrink or source.endswith(formats_to_convert) or too_large(file_size)
+    if (max(real_width, real_height) <= level or not needs_magick) and osp.getsize(image) <= MAX_ENTRY_SIZE:
+        # the image itself
+        with open(image, "rb") as img:
+            pack.append(source, stamp, level, osp.splitext(image)[1][1:], real_width, real_height,
+                        real_width, real_height, file_size, True, base64.b64encode(img.read()), frames)
+    else:
+        thumb = temp_path("thumbnail_", "%s|%s|%d" % (source, stamp, level), ".png")
+        try:
+            # not enlarged when it's only too heavy
+            magick(image, thumb, "-thumbnail", "%dx%d" % (min(level, real_width), min(level, real_height)))
+            width, height, _ = get_image_size(thumb)
+            if osp.getsize(thumb) > MAX_ENTRY_SIZE:
+                os.remove(thumb)
+                return
+            with open(thumb, "rb") as img:
+                payload = base64.b64encode(img.read())
+            os.remove(thumb)
+        # Imagemagick is not available
+        except (OSError, UnknownImageFormat):
+            return
+        pack.append(source, stamp, level, "png", width, height, real_width, real_height, file_size, False, payload,
+                    frames)
+
+    if pack.needs_compaction():
+        pack.compact()
+
+
 def check_recursive(base_folders, name) -> 'Optional[Tuple[str, str]]':
     """
     Return the path to the base folder and the path to the file if it is
@@ -134,12 +462,58 @@ def check_recursive(base_folders, name) -> 'Optional[Tuple[str, str]]':
     return None
 
 
-def get_file(view: sublime.View, string: str, name: str) -> 'Tuple[str, Optional[str]]':
+def project_files(base_folders) -> 'Dict[str, Tuple[str, str]]':
+    """
+    Walk the project once and index its files by name, to what
+    `check_recursive` would return for them.
+    """
+
+    index = {}  # type: Dict[str, Tuple[str, str]]
+    for base_folder in base_folders:
+        for root, dirs, files in os.walk(base_folder):
+            for f in files:
+                # the first one found, as `check_recursive` does
+                index.setdefault(f, (osp.dirname(base_folder), root))
+    return index
+
+
+def get_resolver(view: sublime.View) -> 'Optional[AssetResolver]':
+    """Return the resolver of the asset roots and aliases of the view's project, None without any."""
+
+    from .utils.resolver import AssetResolver  # type: ignore
+
+    # a project can set its own in its "settings"
+    settings = view.settings()
+    roots = settings.get("image_preview.asset_roots", Settings.asset_roots)
+    aliases = settings.get("image_preview.path_aliases", Settings.path_aliases)
+    if not roots and not aliases:
+        return None
+    folders = tuple(sublime.active_window().folders())
+    key = folders, tuple(roots), tuple(sorted(aliases.items()))
+    resolver = resolvers.get(key)
+    if resolver is None:
+        resolver = resolvers[key] = AssetResolver(folders, roots, aliases)
+    return resolver
+
+
+def get_file(view: sublime.View, string: str, name: str,
+             index: 'Optional[Dict[str, Tuple[str, str]]]' = None) -> 'Tuple[str, Optional[str]]':
     """
     Try to get a file from the given `string` and test whether it's in the
     project directory.
+
+    `index` is the `project_files` of the project, to look the names up in
+    instead of walking the project for each of them.
     """
 
+    # web projects paths (e.g /img/logo.png in public/ or @/assets/logo.png)
+    resolver = get_resolver(view)
+    if resolver:
+        resolved = resolver.resolve(string)
+        if resolved:
+            return resolved
+
+    string = osp.expanduser(string)
     # if it's an absolute path get it
     if osp.isabs(string):
         return string, None
@@ -150,7 +524,7 @@ def get_file(view: sublime.View, string: str, name: str) -> 'Tuple[str, Optional
         base_folders = sublime.active_window().folders()
         # if "recursive": true, recursively search for the name
         if Settings.recursive:
-            ch_rec = check_recursive(base_folders, name)
+            ch_rec = index.get(name) if index is not None else check_recursive(base_folders, name)
             if ch_rec:
                 base_folder, root = ch_rec
                 return osp.join(root, name), base_folder
@@ -167,9 +541,64 @@ def get_file(view: sublime.View, string: str, name: str) -> 'Tuple[str, Optional
         return osp.normpath(osp.join(osp.dirname(view.file_name()), string)), None
 
 
+def find_mirror(view: sublime.View, url: str) -> 'Optional[Tuple[str, Optional[str]]]':
+    """
+    Return the local copy of `url` and the project folder it's in, using the
+    first `Settings.url_mirrors` rule that maps it to an existing file.
+    """
+
+    from urllib.parse import unquote
+
+    folders = sublime.active_window().folders()
+    if view.file_name() and not folders:
+        bases = [(osp.dirname(view.file_name()), None)]  # type: List[Tuple[str, Optional[str]]]
+    else:
+        # relative to the project folders
+        bases = [(folder, folder) for folder in folders]
+
+    # the query and the fragment aren't part of the file's path
+    url = re.split(r"[?#]", url, 1)[0]
+    for rule in Settings.url_mirrors:
+        # without a path the url would be mapped to the root of the file system
+        if not rule.get("path"):
+            continue
+        if "url" in rule:
+            if not url.startswith(rule["url"]):
+                continue
+            root = rule["path"]
+            path = root.rstrip("/\\") + "/" + url[len(rule["url"]):]
+        elif "pattern" in rule:
+            try:
+                match = re.match(rule["pattern"], url)
+                if not match:
+                    continue
+                path = match.expand(rule["path"])
+            except (re.error, IndexError) as e:
+                print("[ImagePreview] invalid url mirror %s: %s" % (rule, e))
+                continue
+            # the folder of the path before its first group
+            root = osp.dirname(re.split(r"\\[\dg]", rule["path"], 1)[0])
+        else:
+            continue
+
+        root = osp.expanduser(root)
+        path = osp.expanduser(unquote(path))
+        for base, folder in bases:
+            root_folder = osp.normpath(osp.join(base, root))
+            file = osp.normpath(osp.join(base, path))
+            # `..` in the url can't leave the folder the rule maps to
+            if not file.startswith(root_folder.rstrip(os.sep) + os.sep):
+                continue
+            if osp.isfile(file):
+                return file, None if osp.isabs(root) else folder
+    return None
+
+
 def save(file: str, name: str, kind: str, folder=None, convert=False):
     """Save the image if it's not already in the project folders."""
 
+    import shutil
+
     # all folders in the project
     base_folders = sublime.active_window().folders()
     # create the image folder in the first folder
@@ -221,60 +650,319 @@ def convert(file: str, kind: str, name=None):
     sublime.active_window().show_quick_panel(other_formats, on_done)
 
 
-def handle_as_url(view: sublime.View, point: int, string: str, name: str):
-    """Handle the given `string` as a url."""
+def open_url(string: str, timeout=30):
+    """Open the given `string` as a url, trying its unquoted and quoted forms first."""
 
-    # Let's assume this url as input:
-    # (https://upload.wikimedia.org/wikipedia/commons/8/84/Example.svg)
+    from urllib.parse import quote, unquote
+    from urllib.request import urlopen
 
-    # Download the image
-    # FIXME: avoid nested try-except clauses
     try:
+        return urlopen(unquote(string), timeout=timeout)
+    except Exception:
         try:
-            f = urlopen(unquote(string))  # <==
+            url_path = quote(string).replace("%3A", ':', 1)
+            return urlopen(url_path, timeout=timeout)
         except Exception:
-            try:
-                url_path = quote(string).replace("%3A", ':', 1)
-                f = urlopen(url_path)
-            except Exception:
-                f = urlopen(string)
-    # don't fill the console with stack-trace when there`s no connection !!
-    except Exception as e:
-        print(e)
+            return urlopen(string, timeout=timeout)
+
+
+def find_references(string: str) -> 'List[Tuple[str, Match]]':
+    """
+    Return the (kind, match) of every image reference in `string`.
+
+    Patterns are tried in the same order as in `preview_image`, a match
+    overlapping an earlier one (e.g the name part of a url) is ignored.
+    """
+
+    found = []  # type: List[Tuple[str, Match]]
+    # sorted, non overlapping (start, end) spans of the matches found so far
+    taken = []  # type: List[Tuple[int, int]]
+    for kind in KINDS:
+        matches = []
+        for match in pattern(kind).finditer(string):
+            i = bisect(taken, match.span())
+            if i and taken[i - 1][1] > match.start():
+                continue
+            if i < len(taken) and taken[i][0] < match.end():
+                continue
+            matches.append((kind, match))
+        found.extend(matches)
+        taken = sorted(taken + [match.span() for _, match in matches])
+    return found
+
+
+def save_all(view: sublime.View, references: 'List[Tuple[str, Match]]'):
+    """Download, convert and save all the referenced images that are not already in the project."""
+
+    import hashlib
+    import shutil
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    # all folders in the project
+    base_folders = view.window().folders()
+    if not base_folders:
+        sublime.status_message("Open a folder to save images in")
         return
+    # create the image folder in the first folder
+    image_folder = osp.join(base_folders[0], Settings.image_folder_name)
+    # a relative version of the image_folder for display in the status message
+    image_folder_rel = osp.relpath(image_folder, osp.dirname(base_folders[0]))
+    if not osp.exists(image_folder):
+        os.mkdir(image_folder)
+
+    # walk the project once instead of calling `check_recursive` for every image
+    present = project_files(base_folders)
+    # name of a copy -> the url, data url or file it's a copy of
+    claimed = {}  # type: Dict[str, str]
+    lock = threading.Lock()
+    download_dir = tempfile.mkdtemp()
+
+    def target(name, source):
+        """Return the name of the copy of `source` to save, None if it's already in the project or saved."""
+
+        stem, ext = osp.splitext(name)
+        if name.endswith(formats_to_convert):
+            ext = ".png"
+        out = stem + ext
+        with lock:
+            if name in present or out in present:
+                return None
+            # a different image with the same name gets a numbered copy
+            n = 1
+            while out in claimed or out in present:
+                if claimed.get(out) == source:
+                    return None
+                n += 1
+                out = "%s-%d%s" % (stem, n, ext)
+            claimed[out] = source
+        return out
+
+    def download_path(name, out):
+        return osp.join(download_dir, osp.splitext(out)[0] + osp.splitext(name)[1])
+
+    def store(file, name, out):
+        copy = osp.join(image_folder, out)
+        if osp.splitext(out)[1] == osp.splitext(name)[1]:
+            shutil.copyfile(file, copy)
+        else:
+            magick(file, copy)
+            if not osp.exists(copy):
+                raise OSError("could not convert " + name)
+
+    def save_one(kind, match):
+        if kind == "url":
+            string, protocol, name = match.group(0, 1, 2)
+            if not protocol:
+                string = "http://" + string
+            out = target(name, string)
+            if out:
+                temp_img = download_path(name, out)
+                with open(temp_img, "wb") as img:
+                    img.write(open_url(string).read())
+                store(temp_img, name, out)
+
+        elif kind == "data_url":
+            ext, encoded = match.groups()
+            if ext == "svg+xml":
+                ext = "svg"
+            name = str(int(hashlib.sha1(encoded.encode('utf-8')).hexdigest(), 16) % (10 ** 8)) + "." + ext
+            out = target(name, name)
+            if out:
+                temp_img = download_path(name, out)
+                with open(temp_img, "wb") as img:
+                    img.write(base64.b64decode(encoded))
+                store(temp_img, name, out)
+
+        else:
+            string = match.group(0)
+            name = osp.basename(string)
+            if Settings.search_mode == "project" and Settings.recursive and not osp.isabs(string):
+                # the walk above already found every file of the project
+                if name in present:
+                    return False
+                raise FileNotFoundError(string)
+            file, folder = get_file(view, string, name)
+            if not osp.isfile(file):
+                raise FileNotFoundError(string)
+            out = None if folder else target(name, osp.normpath(file))
+            if out:
+                store(file, name, out)
+
+        return bool(out)
+
+    saved = skipped = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=Settings.max_parallel_downloads) as executor:
+        futures = {executor.submit(save_one, kind, match): match.group(0) for kind, match in references}
+        for i, future in enumerate(as_completed(futures), 1):
+            sublime.status_message("Saving images %d/%d" % (i, len(futures)))
+            try:
+                if future.result():
+                    saved += 1
+                else:
+                    skipped += 1
+            except Exception as e:
+                failed.append((futures[future], e))
+
+    shutil.rmtree(download_dir, ignore_errors=True)
+    for string, e in failed:
+        print("[ImagePreview] could not save %s: %s" % (string, e))
+    sublime.status_message("%d saved in %s, %d already in the project, %d failed" %
+                           (saved, image_folder_rel, skipped, len(failed)))
+
+
+class Hover:
+    """
+    A preview being prepared for the image at `point`.
+
+    If it isn't ready within `Settings.latency_budget` milliseconds, the
+    `fallback` popup (or a loading one) is shown instead and replaced by the
+    preview once it's ready, unless the mouse moved away in the meantime or
+    another image of the view was hovered since.
+    """
+
+    def __init__(self, view: sublime.View, point: int, kind: str, reference: str, name: str):
+        from .utils.latency import LatencyBudget  # type: ignore
+
+        self.view = view
+        self.point = point
+        # one of KINDS and the hovered text
+        self.kind = kind
+        self.reference = reference
+        self.name = name
+        # the local file the reference was resolved to, if any
+        self.path = None  # type: Optional[str]
+        self.budget = LatencyBudget(Settings.latency_budget)
+        # (html, on_navigate) of a cheaper preview
+        self.fallback = None  # type: Optional[Tuple[str, Optional[Callable[[str], None]]]]
+        self.lock = threading.Lock()
+        # "pending", "degraded" once the fallback is shown, "done"
+        self.state = "pending"
+        hovers[view.id()] = self
+        if Settings.latency_budget > 0:
+            sublime.set_timeout(self.degrade, Settings.latency_budget)
+
+    def stage(self, name: str):
+        return self.budget.stage(name)
+
+    def popup(self, html: str, on_navigate=None):
+        self.view.show_popup(
+            html,
+            sublime.HIDE_ON_MOUSE_MOVE_AWAY,
+            self.point,
+            *self.view.viewport_extent(),
+            on_navigate=on_navigate)
+
+    def superseded(self) -> bool:
+        return hovers.get(self.view.id()) is not self
+
+    def degrade(self):
+        with self.lock:
+            if self.state != "pending" or self.superseded():
+                return
+            self.state = "degraded"
+        html, on_navigate = self.fallback or (LOADING_TEMPLATE % self.name, None)
+        self.popup(html, on_navigate)
+
+    def show(self, html: str, on_navigate):
+        with self.lock:
+            degraded = self.state == "degraded"
+            self.state = "done"
+        # the mouse moved away from the fallback or to another image, what was computed is cached for the next hover
+        if self.superseded() or degraded and not self.view.is_popup_visible():
+            return
+        self.popup(html, on_navigate)
+
+    def cancel(self):
+        """Stop waiting for a preview that won't come."""
+
+        with self.lock:
+            degraded = self.state == "degraded"
+            self.state = "done"
+        # the popup is another hover's
+        if degraded and not self.superseded():
+            self.view.hide_popup()
+
+    def tags(self) -> dict:
+        """Describe this preview for the profile of a slow one."""
+
+        return {
+            "kind": self.kind,
+            # data URLs can be huge
+            "reference": self.reference[:200],
+            "path": self.path,
+            "stages": self.budget.stages,
+            "settings": {key: value for key, value in vars(Settings).items()
+                         if not key.startswith("_") and isinstance(value, (bool, int, float, str, list, dict))},
+        }
+
+
+def handle_as_url(hover: Hover, string: str, name: str):
+    """Handle the given `string` as a url."""
+
+    import hashlib
+    import shutil
+    import time
+
+    view = hover.view
+
+    # a copy of the image in the project is previewed instead, the network is only used without one
+    if Settings.url_mirrors:
+        with hover.stage("mirror"):
+            mirror = find_mirror(view, string)
+        if mirror:
+            hover.path = mirror[0]
+            return preview_file(hover, mirror[0], osp.basename(mirror[0]), mirror[1])
+
+    # Let's assume this url as input:
+    # (https://upload.wikimedia.org/wikipedia/commons/8/84/Example.svg)
 
     # file needs conversion ?
     need_conversion = name.endswith(formats_to_convert)  # => True
     basename, ext = osp.splitext(name)  # => ("Example", ".svg")
-    # create a temporary file
-    temp_img = osp.join(TEMP_DIR, "tmp_image" + ext)  # => "TEMP_DIR/tmp_image.svg"
-
-    # Save downloaded data in the temporary file
-    content = f.read()
-    with open(temp_img, "wb") as img:
-        img.write(content)
+    # create a temporary file, one per url so that it can be reused by the next hovers
+    digest = hashlib.sha1(string.encode("utf-8")).hexdigest()[:12]
+    temp_img = osp.join(get_temp_dir(), "tmp_image_" + digest + ext)  # => "TEMP_DIR/tmp_image_<digest>.svg"
+    hover.path = temp_img
+
+    downloaded_at = downloaded.get(string)
+    if downloaded_at is None or time.time() - downloaded_at > Settings.downloaded_images_lifetime or \
+            not osp.exists(temp_img):
+        # Download the image
+        with hover.stage("download"):
+            try:
+                f = open_url(string)  # <==
+                # Save downloaded data in the temporary file
+                with open(temp_img, "wb") as img:
+                    shutil.copyfileobj(f, img)
+            # don't fill the console with stack-trace when there`s no connection !!
+            except Exception as e:
+                print(e)
+                return
+        downloaded[string] = time.time()
+
+    # animations are previewed from their first frame
+    with hover.stage("animation"):
+        image, frames = poster_frame(temp_img)  # => "TEMP_DIR/tmp_image_<digest>.svg"
+    source_size = osp.getsize(temp_img) if frames > 1 else None
 
     # if the file needs conversion, convert it then read data from the resulting png
     if need_conversion:
         ext = ".png"
         # keep the image's temporary file and name for later use
-        conv_file = temp_img  # => "TEMP_DIR/tmp_image.svg"
+        conv_file = temp_img  # => "TEMP_DIR/tmp_image_<digest>.svg"
 
-        # => "TEMP_DIR/tmp_image.png"
+        # => "TEMP_DIR/tmp_image_<digest>.png"
         temp_png = osp.splitext(temp_img)[0] + ".png"
 
         # use the magick command of Imagemagick to convert the image to png
-        magick(temp_img, temp_png)
-
-        # read data from the resulting png
-        with open(temp_png, "rb") as png:
-            content = png.read()
+        if not osp.exists(temp_png) or osp.getmtime(temp_png) < osp.getmtime(conv_file):
+            with hover.stage("convert"):
+                magick(image, temp_png)
 
         # set temp_file and name to the png file
-        temp_img = temp_png  # => "TEMP_DIR/tmp_image.png"
-
-    width, height, real_width, real_height, size = get_data(view, temp_img)
-    encoded = str(base64.b64encode(content), "utf-8")
+        temp_img = image = temp_png  # => "TEMP_DIR/tmp_image_<digest>.png"
 
     def on_navigate(href):
 
@@ -289,21 +977,21 @@ def handle_as_url(view: sublime.View, point: int, string: str, name: str):
             else:
                 convert(temp_img, "url", name)
         else:
+            # the whole animation, not only the first frame shown in the popup
             sublime.active_window().open_file(temp_img)
 
-    view.show_popup(
-        TEMPLATE % (width, height, ext, encoded, real_width, real_height,
-                    str(size // 1024) + "KB" if size >= 1024 else str(size) + 'B'),
-        sublime.HIDE_ON_MOUSE_MOVE_AWAY,
-        point,
-        *view.viewport_extent(),
-        on_navigate=on_navigate
-    )
+    with hover.stage("encode"):
+        html = file_popup(view, image, ext, source_size, frames)
+    hover.show(html, on_navigate)
 
 
-def handle_as_data_url(view: sublime.View, point: int, ext: str, encoded: str):
+def handle_as_data_url(hover: Hover, ext: str, encoded: str):
     """Handle the string as a data url."""
 
+    import hashlib
+
+    view = hover.view
+
     need_conversion = False
     # TODO: is this the only case ?
     if ext == "svg+xml":
@@ -311,19 +999,53 @@ def handle_as_data_url(view: sublime.View, point: int, ext: str, encoded: str):
         need_conversion = True
 
     # create a temporary file
-    temp_img = osp.join(TEMP_DIR, "tmp_data_image." + ext)
+    temp_img = osp.join(get_temp_dir(), "tmp_data_image." + ext)
+    hover.path = temp_img
     basename = str(int(hashlib.sha1(encoded.encode('utf-8')).hexdigest(), 16) % (10 ** 8))
     name = basename + "." + ext
 
+    # the size of the image, without decoding it
+    compact = encoded.replace(" ", "")
+    size = len(compact) * 3 // 4 - compact.count("=", -2)
+    if too_large(size):
+        from io import BytesIO
+        from .utils.get_image_size import get_image_metadata_from_bytesio  # type: ignore
+
+        try:
+            # the dimensions are at the start of the image
+            image = get_image_metadata_from_bytesio(BytesIO(base64.b64decode(compact[:1 << 16])), size)
+            real_width, real_height = image.width, image.height
+        except (ValueError, UnknownImageFormat):
+            real_width = real_height = -1
+
+        # decode the image only if it's opened or saved
+        def decoded():
+            with open(temp_img, "wb") as img:
+                img.write(base64.b64decode(compact))
+            return temp_img
+
+        def on_navigate_too_large(href):
+
+            if href == "save":
+                save(decoded(), name, "data_url")
+            elif href == "save_as":
+                convert(decoded(), "data_url", name)
+            else:
+                sublime.active_window().open_file(decoded())
+
+        return hover.show(DIMENSIONS_TEMPLATE % (real_width, real_height, human_size(size), "too large to preview"),
+                          on_navigate_too_large)
+
     # Save downloaded data in the temporary file
-    try:
-        img = open(temp_img, "wb")
-        img.write(base64.b64decode(encoded))
-    except Exception as e:
-        print(e)
-        return
-    finally:
-        img.close()
+    with hover.stage("decode"):
+        try:
+            img = open(temp_img, "wb")
+            img.write(base64.b64decode(encoded))
+        except Exception as e:
+            print(e)
+            return
+        finally:
+            img.close()
 
     if need_conversion:
         ext = ".png"
@@ -332,10 +1054,8 @@ def handle_as_data_url(view: sublime.View, point: int, ext: str, encoded: str):
 
         temp_png = osp.splitext(temp_img)[0] + ".png"
 
-        magick(temp_img, temp_png)
-
-        with open(temp_png, "rb") as png:
-            encoded = str(base64.b64encode(png.read()), "utf-8")
+        with hover.stage("convert"):
+            magick(temp_img, temp_png)
 
         temp_img = temp_png
 
@@ -354,50 +1074,123 @@ def handle_as_data_url(view: sublime.View, point: int, ext: str, encoded: str):
         else:
             sublime.active_window().open_file(temp_img)
 
-    width, height, real_width, real_height, size = get_data(view, temp_img)
+    with hover.stage("encode"):
+        if need_conversion:
+            html = file_popup(view, temp_img, ext)
+        else:
+            # the payload is already encoded in the view
+            width, height, real_width, real_height, size = get_data(view, temp_img)
+            html = TEMPLATE % (width, height, ext, encoded, real_width, real_height, human_size(size))
+    hover.show(html, on_navigate)
 
-    view.show_popup(
-        TEMPLATE % (width, height, ext, encoded, real_width, real_height,
-                    str(size // 1024) + "KB" if size >= 1024 else str(size) + 'B'),
-        sublime.HIDE_ON_MOUSE_MOVE_AWAY,
-        point,
-        *view.viewport_extent(),
-        on_navigate=on_navigate
-    )
 
+def find_archive(view: sublime.View, string: str) -> str:
+    """Return the archive file `string` refers to, remembered as long as it exists."""
 
-def handle_as_file(view: sublime.View, point: int, string: str):
+    key = tuple(sublime.active_window().folders()), string
+    archive = archive_paths.get(key)
+    if not archive or not osp.isfile(archive):
+        archive = archive_paths[key] = get_file(view, string, osp.basename(string))[0]
+    return archive
+
+
+def handle_as_file(hover: Hover, string: str):
     """Handle the given `string` as a file."""
 
+    from .utils.archive import find_member  # type: ignore
+
+    # a member of an archive (e.g assets.zip/icons/logo.png) is looked up in
+    # the archive, not by its name in the project
+    with hover.stage("resolve"):
+        member = find_member(string, lambda archive_string: find_archive(hover.view, archive_string))
+    if member:
+        hover.path = "/".join(member)
+        return handle_as_archive_member(hover, *member)
+
     name = osp.basename(string)
-    file, folder = get_file(view, string, name)
+    with hover.stage("resolve"):
+        file, folder = get_file(hover.view, string, name)
+    hover.path = file
 
     # if file doesn't exist, return
     if not osp.isfile(file):
         return
 
-    # does the file need conversion ?
-    need_conversion = file.endswith(formats_to_convert)
-    ext = name.rsplit('.', 1)[1]
+    preview_file(hover, file, name, folder)
 
-    # if the file needs conversion, convert it and read data from the resulting png
-    if need_conversion:
-        ext = ".png"
-        # keep the image's file and name for later use
-        conv_file = file
 
-        # create a temporary file
-        temp_png = osp.join(TEMP_DIR, "temp_png.png")
+def handle_as_archive_member(hover: Hover, archive: str, member: str):
+    """Handle the given `member` of the zip based `archive` file."""
 
-        # use the magick command of Imagemagick to convert the image to png
-        magick(file, temp_png)
+    import hashlib
+
+    name = osp.basename(member)
+    archives = get_archives()
+    # the dimensions are read from the first bytes of the member, before decompressing the rest
+    with hover.stage("archive"):
+        try:
+            image = archives.metadata(archive, member)
+        # not a member of the archive
+        except KeyError:
+            return
+        except UnknownImageFormat:
+            image = None
+        except Exception as e:
+            print(e)
+            return
 
-        file = temp_png
+    # one temporary file per version of the member so that it can be reused by the next hovers
+    key = "%s|%d|%s" % (archive, os.stat(archive).st_mtime_ns, member)
+    temp_img = osp.join(get_temp_dir(), "member_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12] +
+                        osp.splitext(name)[1])
 
-    with open(file, "rb") as img:
-        encoded = str(base64.b64encode(img.read()), "utf-8")
+    def extracted():
+        if not osp.exists(temp_img):
+            archives.extract(archive, member, temp_img + ".part")
+            os.replace(temp_img + ".part", temp_img)
+        return temp_img
 
-    width, height, real_width, real_height, size = get_data(view, file)
+    if image:
+        caption = (image.width, image.height, human_size(image.file_size))
+
+        if too_large(image.file_size):
+            # extract the member only if it's opened or saved
+            def on_navigate(href):
+
+                if href == "save":
+                    save(extracted(), name, "file")
+                elif href == "save_as":
+                    convert(extracted(), "file", name)
+                else:
+                    sublime.active_window().open_file(extracted())
+
+            return hover.show(DIMENSIONS_TEMPLATE % (caption + ("too large to preview",)), on_navigate)
+
+        hover.fallback = DIMENSIONS_TEMPLATE % (caption + ("loading",)), None
+
+    with hover.stage("extract"):
+        file = extracted()
+
+    preview_file(hover, file, name, None)
+
+
+def preview_file(hover: Hover, file: str, name: str, folder: 'Optional[str]'):
+    """Preview the image `file`, `folder` is the project folder it was found in."""
+
+    view = hover.view
+
+    # does the file need conversion ?
+    need_conversion = file.endswith(formats_to_convert)
+    ext = name.rsplit('.', 1)[1]
+    # keep the image's file and name for later use
+    conv_file = file
+    # the image rendered in the popup, the first frame of an animation
+    image = file
+    frames = 1
+
+    def converted():
+        # use the magick command of Imagemagick to convert the image to png
+        return converted_png(conv_file, image)
 
     def on_navigate(href):
 
@@ -407,17 +1200,80 @@ def handle_as_file(view: sublime.View, point: int, string: str):
             else:
                 save(file, name, "file", folder)
         elif href == "save_as":
-            convert(conv_file if need_conversion else file, "file")
+            convert(conv_file, "file")
+        elif frames > 1:
+            # the whole animation, not only the first frame shown in the popup
+            sublime.active_window().open_file(conv_file)
+        elif need_conversion and file == conv_file:
+            # the preview came from the thumbnail pack, nothing was converted yet
+            sublime.active_window().open_file(converted())
         else:
             sublime.active_window().open_file(file)
 
-    view.show_popup(
-        TEMPLATE % (width, height, ext, encoded, real_width, real_height,
-                    str(size // 1024) + "KB" if size >= 1024 else str(size) + 'B'),
-        sublime.HIDE_ON_MOUSE_MOVE_AWAY,
-        point,
-        *view.viewport_extent(),
-        on_navigate=on_navigate)
+    pack = get_thumbnail_pack()
+    html = None
+    if pack:
+        from .utils.thumbnail_pack import file_stamp  # type: ignore
+
+        stamp = file_stamp(file)
+        with hover.stage("thumbnail"):
+            entry = find_thumbnail(view, pack, file, stamp)
+            html = entry and thumbnail_popup(view, pack, entry)
+            if html:
+                frames = entry.frames
+            # a lower resolution thumbnail is better than nothing if the budget runs out
+            lower = not html and find_thumbnail(view, pack, file, stamp, fit=False)
+            lower_html = lower and thumbnail_popup(view, pack, lower)
+            if lower_html:
+                hover.fallback = lower_html, on_navigate
+
+    if not html:
+        # animations are previewed from their first frame
+        with hover.stage("animation"):
+            image, frames = poster_frame(file)
+        source_size = osp.getsize(file) if frames > 1 else None
+
+        if not need_conversion and not hover.fallback:
+            # only the dimensions, they can be read without loading the image
+            width, height, real_width, real_height, size = get_data(view, image)
+            if size >= 0:
+                hover.fallback = DIMENSIONS_TEMPLATE % (real_width, real_height,
+                                                        human_size(source_size or size, frames),
+                                                        "loading"), on_navigate
+
+        # if the file needs conversion, convert it and read data from the resulting png
+        if need_conversion:
+            ext = ".png"
+            with hover.stage("convert"):
+                image = converted()
+            file = image
+
+        # a too large file gets a thumbnail from the pack the next time
+        with hover.stage("encode"):
+            html = file_popup(view, image, ext, source_size, frames)
+
+        if pack:
+            # only the level filling the popup is made, in the background
+            width, height = get_data(view, image)[:2]
+            if width > 0:
+                queue_thumbnail(pack, conv_file, stamp, int(max(width, height)), image, frames)
+
+    hover.show(html, on_navigate)
+
+
+def handle(hover: Hover, handler, *args):
+    """Run the `handler` of the hovered image, giving up on the preview if it fails."""
+
+    try:
+        if Settings.profile_slow_previews:
+            from .utils.profiling import profiled  # type: ignore
+
+            with profiled(get_profiles_dir(), Settings.slow_preview_threshold, Settings.max_profiles, hover.tags):
+                handler(hover, *args)
+        else:
+            handler(hover, *args)
+    finally:
+        hover.cancel()
 
 
 def preview_image(view: sublime.View, point: int):
@@ -430,9 +1286,11 @@ def preview_image(view: sublime.View, point: int):
     offset_point = point - line.a
 
     # search for the match in the string that contains the point
+    # the handlers run in the background so that ST isn't blocked and the
+    # latency budget can show a fallback in the meantime
 
     # ==================URL=====================
-    for match in image_url_re.finditer(string):
+    for match in pattern("url").finditer(string):
         if match.start() <= offset_point <= match.end():
             string, protocol, name = match.group(0, 1, 2)
             # if the url doesn't start with http or https try adding it
@@ -441,27 +1299,29 @@ def preview_image(view: sublime.View, point: int):
                 string = "http://" + string
             # print("[Image Preview] URL:", match.group(0, 1, 2))
 
-            # don't block ST while handling the url
-            return sublime.set_timeout_async(lambda: handle_as_url(view, point, string, name), 0)
+            hover = Hover(view, point, "url", match.group(0), name)
+            # downloads get their own thread so that they don't hold up the
+            # local previews on the async one
+            return threading.Thread(target=handle, args=(hover, handle_as_url, string, name), daemon=True).start()
 
     # =================DATA URL=================
-    for match in IMAGE_DATA_URL_RE.finditer(string):
+    for match in pattern("data_url").finditer(string):
         if match.start() <= offset_point <= match.end():
             # print("[Image Preview] data URL:", match.groups())
-            return handle_as_data_url(view, point, *match.groups())
+            hover = Hover(view, point, "data_url", match.group(0), "data URL")
+            groups = match.groups()
+            return sublime.set_timeout_async(lambda: handle(hover, handle_as_data_url, *groups), 0)
 
     # =================FILE=====================
     # find full and relative paths (e.g ./screenshot.png)
-    for match in image_file_re.finditer(string):
-        if match.start() <= offset_point <= match.end():
-            # print("[Image Preview] file:", match.group(0))
-            return handle_as_file(view, point, match.group(0))
-
-    # find file name (e.g screenshot.png)
-    for match in image_file_name_re.finditer(string):
-        if match.start() <= offset_point <= match.end():
-            # print("[Image Preview] filename:", match.group(0))
-            return handle_as_file(view, point, match.group(0))
+    # and file names (e.g screenshot.png)
+    for kind in ("file", "name"):
+        for match in pattern(kind).finditer(string):
+            if match.start() <= offset_point <= match.end():
+                # print("[Image Preview] file:", match.group(0))
+                hover = Hover(view, point, kind, match.group(0), osp.basename(match.group(0)))
+                string = match.group(0)
+                return sublime.set_timeout_async(lambda: handle(hover, handle_as_file, string), 0)
 
 
 class HoverPreviewImage(sublime_plugin.EventListener):
@@ -474,6 +1334,210 @@ class HoverPreviewImage(sublime_plugin.EventListener):
         preview_image(view, point)
 
 
+class InlineThumbnails(sublime_plugin.ViewEventListener):
+    """
+    Thumbnails of the images referenced in the visible part of the view, as phantoms.
+
+    They are taken from the thumbnail pack, and updated when the view is
+    scrolled or modified. An update started before the latest scroll or
+    modification is abandoned.
+    """
+
+    @classmethod
+    def is_applicable(cls, settings):
+        return not settings.get("is_widget")
+
+    def __init__(self, view: sublime.View):
+        super().__init__(view)
+        self.phantom_set = sublime.PhantomSet(view, "image_preview")
+        # incremented on every scroll or modification
+        self.generation = 0
+        self.visible = None  # type: Optional[sublime.Region]
+        self.polling = False
+        # whether there are phantoms to remove once the setting is turned off
+        self.shown = False
+        # reference -> resolved file, None if it wasn't found
+        self.files = {}  # type: Dict[str, Optional[str]]
+        # the references being resolved by the packer
+        self.resolving = set()  # type: Set[str]
+        # (project folders, settings_version) the files were resolved with
+        self.files_key = None  # type: Optional[tuple]
+        # (file, stamp) whose thumbnail was asked to the packer
+        self.requested = set()  # type: Set[Tuple[str, str]]
+
+    def on_activated(self):
+        # the missing images may have been created meanwhile
+        self.files = {string: file for string, file in list(self.files.items()) if file}
+        if not self.polling and Settings.inline_thumbnails:
+            self.polling = True
+            self.poll()
+
+    def on_deactivated(self):
+        self.polling = False
+
+    def on_close(self):
+        self.polling = False
+
+    def on_modified(self):
+        if Settings.inline_thumbnails or self.shown:
+            self.schedule(300)
+
+    def poll(self):
+        """Check whether the view was scrolled, there's no event for it."""
+
+        # turned off, `toggle_inline_thumbnails` starts it again
+        if not self.polling or not Settings.inline_thumbnails or not self.view.is_valid():
+            self.polling = False
+            return
+        visible = self.view.visible_region()
+        if visible != self.visible:
+            self.visible = visible
+            self.schedule(100)
+        sublime.set_timeout(self.poll, 200)
+
+    def schedule(self, delay: int):
+        self.generation += 1
+        generation = self.generation
+        sublime.set_timeout_async(lambda: self.update(generation), delay)
+
+    def resolve(self, strings: 'List[str]', key: tuple):
+        """
+        Find the files `strings` refer to, on the packer thread.
+
+        The project is walked once for all of them. The references that
+        aren't found are remembered too, so that they aren't searched again
+        on every update until the project folders or the settings change.
+        """
+
+        try:
+            index = None
+            if Settings.search_mode == "project" and Settings.recursive:
+                index = project_files(key[0])
+            for string in strings:
+                file, _ = get_file(self.view, string, osp.basename(string), index)
+                # the project or the settings changed meanwhile
+                if key == self.files_key:
+                    self.files[string] = file if osp.isfile(file) else None
+        finally:
+            self.resolving.difference_update(strings)
+
+    def update(self, generation: int):
+        pack = get_thumbnail_pack()
+        if not Settings.inline_thumbnails or not pack:
+            self.phantom_set.update([])
+            self.shown = False
+            return
+
+        from .utils.thumbnail_pack import file_stamp  # type: ignore
+
+        key = tuple(sublime.active_window().folders()), settings_version
+        if key != self.files_key:
+            self.files = {}
+            self.files_key = key
+        phantoms = []
+        missing = []
+        unresolved = []
+        payload = 0
+        max_payload = Settings.max_inline_thumbnails_size * 1024 * 1024
+        for line in self.view.lines(self.view.visible_region()):
+            for kind, match in find_references(self.view.substr(line)):
+                # superseded by a scroll or a modification
+                if generation != self.generation:
+                    return
+                if kind not in ("file", "name") or len(phantoms) >= Settings.max_inline_thumbnails:
+                    continue
+
+                string = match.group(0)
+                file = self.files.get(string)
+                if string not in self.files or file and not osp.isfile(file):
+                    if string not in self.resolving and string not in unresolved:
+                        unresolved.append(string)
+                    continue
+                if not file:
+                    continue
+                stamp = file_stamp(file)
+                entries = pack.entries(file, stamp)
+                if not entries:
+                    if (file, stamp) not in self.requested:
+                        missing.append((file, stamp))
+                    continue
+
+                # the smallest thumbnail is enough
+                entry = entries[0]
+                encoded = pack.read(entry)
+                if encoded is None or payload + len(encoded) > max_payload:
+                    continue
+                payload += len(encoded)
+
+                scale = min(1, Settings.inline_thumbnail_size / max(entry.width, entry.height))
+                phantoms.append(sublime.Phantom(
+                    sublime.Region(line.a + match.end()),
+                    INLINE_TEMPLATE % (entry.width * scale, entry.height * scale, entry.fmt, encoded),
+                    sublime.LAYOUT_INLINE))
+
+        if generation != self.generation:
+            return
+        self.phantom_set.update(phantoms)
+        self.shown = bool(phantoms)
+
+        # the missing thumbnails are made in the background, then shown
+        for file, stamp in missing:
+            self.requested.add((file, stamp))
+            queue_thumbnail(pack, file, stamp, Settings.inline_thumbnail_size, shrink=True)
+        # so are the files of the references, then their thumbnails
+        if unresolved:
+            self.resolving.update(unresolved)
+            get_packer().submit(self.resolve, unresolved, key)
+        if missing or unresolved:
+            # the packer runs in order, after the thumbnails
+            get_packer().submit(lambda: sublime.set_timeout(lambda: self.schedule(0), 0))
+
+
+class SaveAllImagesCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        # the selected text or the whole file
+        regions = [region for region in self.view.selection if not region.empty()]
+        references = []  # type: List[Tuple[str, Match]]
+        for region in regions or [sublime.Region(0, self.view.size())]:
+            references.extend(find_references(self.view.substr(region)))
+
+        # the same reference is saved once
+        unique = list(OrderedDict((match.group(0), (kind, match)) for kind, match in references).values())
+        if not unique:
+            sublime.status_message("No images found")
+            return
+
+        # the batch waits for its downloads, it would hold up the previews on the async thread
+        threading.Thread(target=save_all, args=(self.view, unique), daemon=True).start()
+
+
+def show_panel(window: sublime.Window, text: str):
+    panel = window.create_output_panel("image_preview")
+    panel.run_command("append", {"characters": text})
+    window.run_command("show_panel", {"panel": "output.image_preview"})
+
+
+class ImagePreviewSlowStagesCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        from .utils.latency import report  # type: ignore
+
+        show_panel(self.window, report())
+
+
+class ImagePreviewLatestProfileCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        from .utils.profiling import latest_summary  # type: ignore
+
+        summary = latest_summary(get_profiles_dir())
+        if summary is None:
+            summary = ("No slow preview was profiled, set profile_slow_previews to true "
+                       "in the settings to profile the previews slower than slow_preview_threshold.")
+        show_panel(self.window, summary)
+
+
 class PreviewImageCommand(sublime_plugin.TextCommand):
 
     def run(self, edit, event=None):
@@ -489,8 +1553,8 @@ class PreviewImageCommand(sublime_plugin.TextCommand):
         string = self.view.substr(line)
         point -= line.a
 
-        for pattern in (image_url_re, IMAGE_DATA_URL_RE, image_file_re, image_file_name_re):
-            for match in pattern.finditer(string):
+        for kind in KINDS:
+            for match in pattern(kind).finditer(string):
                 if match.start() <= point <= match.end():
                     return True
         return False
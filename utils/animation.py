@@ -0,0 +1,175 @@
+"""
+Frame counting and first frame extraction for animated GIF, APNG and WebP
+images, without decoding them - only the os and struct builtin modules.
+"""
+import struct
+
+PNG_SIGNATURE = b'\211PNG\r\n\032\n'
+# APNG chunks describing the frames after the default image
+APNG_CHUNKS = (b'acTL', b'fcTL', b'fdAT')
+
+
+def _image_type(head: bytes) -> str:
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return "gif"
+    if head.startswith(PNG_SIGNATURE):
+        return "png"
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return "webp"
+    return ""
+
+
+def _skip_sub_blocks(f):
+    """Move past a sequence of GIF data sub-blocks, return False on a truncated file."""
+
+    while True:
+        size = f.read(1)
+        if not size:
+            return False
+        if not size[0]:
+            return True
+        f.seek(size[0], 1)
+
+
+def _gif_frames(f, stop_after=0):
+    """
+    Return the number of frames of a GIF and the offset of the end of its first frame.
+
+    The scan stops once `stop_after` frames are found (0 to count all of them).
+    """
+
+    f.seek(10)
+    packed = f.read(3)[0]
+    if packed & 0x80:
+        # global color table
+        f.seek(3 << ((packed & 7) + 1), 1)
+
+    frames = 0
+    first_end = 0
+    while True:
+        introducer = f.read(1)
+        if introducer == b'\x21':
+            # extension: label then data sub-blocks
+            f.seek(1, 1)
+            if not _skip_sub_blocks(f):
+                break
+        elif introducer == b'\x2c':
+            descriptor = f.read(9)
+            if len(descriptor) < 9:
+                break
+            if descriptor[8] & 0x80:
+                # local color table
+                f.seek(3 << ((descriptor[8] & 7) + 1), 1)
+            # LZW minimum code size then the image data
+            f.seek(1, 1)
+            if not _skip_sub_blocks(f):
+                break
+            frames += 1
+            if frames == 1:
+                first_end = f.tell()
+            if frames == stop_after:
+                break
+        else:
+            # trailer, or something that can't be parsed
+            break
+    return frames, first_end
+
+
+def _png_chunks(f):
+    """Yield the (type, offset, length) of the chunks of a PNG."""
+
+    offset = len(PNG_SIGNATURE)
+    while True:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, = struct.unpack(">L", header[:4])
+        yield header[4:], offset, length
+        if header[4:] == b'IEND':
+            return
+        # length, type, data and crc
+        offset += 12 + length
+
+
+def _webp_chunks(f):
+    """Yield the (fourcc, offset of the data, length) of the chunks of a WebP."""
+
+    offset = 12
+    while True:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, = struct.unpack("<L", header[4:])
+        yield header[:4], offset + 8, length
+        # chunks are padded to an even size
+        offset += 8 + length + (length & 1)
+
+
+def frame_count(path: str) -> int:
+    """Return the number of frames of the image at `path`, 1 if it's not animated."""
+
+    with open(path, "rb") as f:
+        kind = _image_type(f.read(16))
+        if kind == "gif":
+            return max(_gif_frames(f)[0], 1)
+        if kind == "png":
+            for chunk, offset, length in _png_chunks(f):
+                if chunk == b'acTL':
+                    f.seek(offset + 8)
+                    return max(struct.unpack(">L", f.read(4))[0], 1)
+                if chunk == b'IDAT':
+                    break
+        elif kind == "webp":
+            frames = sum(1 for chunk, offset, length in _webp_chunks(f) if chunk == b'ANMF')
+            return max(frames, 1)
+    return 1
+
+
+def extract_first_frame(path: str, out: str) -> bool:
+    """Write a still image made of the first frame of the animation at `path` to `out`."""
+
+    with open(path, "rb") as f:
+        kind = _image_type(f.read(16))
+
+        if kind == "gif":
+            frames, first_end = _gif_frames(f, stop_after=1)
+            if not frames:
+                return False
+            f.seek(0)
+            still = f.read(first_end) + b'\x3b'
+
+        elif kind == "png":
+            parts = [PNG_SIGNATURE]
+            for chunk, offset, length in _png_chunks(f):
+                if chunk not in APNG_CHUNKS:
+                    f.seek(offset)
+                    parts.append(f.read(12 + length))
+            still = b''.join(parts)
+
+        elif kind == "webp":
+            for chunk, offset, length in _webp_chunks(f):
+                if chunk == b'ANMF':
+                    f.seek(offset)
+                    frame = f.read(length)
+                    break
+            else:
+                return False
+            # X, Y, width - 1, height - 1, duration on 3 bytes each and flags
+            width = int.from_bytes(frame[6:9], "little") + 1
+            height = int.from_bytes(frame[9:12], "little") + 1
+            body = frame[16:]
+            if body[:4] == b'ALPH':
+                # a lossy image with an alpha channel needs the extended header
+                vp8x = (b'\x10\0\0\0' + (width - 1).to_bytes(3, "little") +
+                        (height - 1).to_bytes(3, "little"))
+                body = b'VP8X' + struct.pack("<L", len(vp8x)) + vp8x + body
+            still = b'RIFF' + struct.pack("<L", 4 + len(body)) + b'WEBP' + body
+
+        else:
+            return False
+
+    with open(out, "wb") as f:
+        f.write(still)
+    return True
@@ -0,0 +1,126 @@
+import os
+import os.path as osp
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+from utils.animation import extract_first_frame, frame_count, PNG_SIGNATURE
+
+
+def gif(frames):
+    """A GIF with a global color table, `frames` 1x1 frames and their graphic control extensions."""
+
+    data = b'GIF89a' + struct.pack("<HHBBB", 1, 1, 0x80, 0, 0) + b'\0\0\0\xff\xff\xff'
+    for _ in range(frames):
+        data += b'\x21\xf9\x04\0\x0a\0\0\0'
+        data += b'\x2c' + struct.pack("<HHHHB", 0, 0, 1, 1, 0) + b'\x02\x02\x4c\x01\0'
+    return data + b'\x3b'
+
+
+def png_chunk(kind, data):
+    return struct.pack(">L", len(data)) + kind + data + struct.pack(">L", zlib.crc32(kind + data))
+
+
+def apng(frames):
+    """An APNG whose default image is its first frame."""
+
+    data = PNG_SIGNATURE + png_chunk(b'IHDR', struct.pack(">LLBBBBB", 2, 3, 8, 6, 0, 0, 0))
+    data += png_chunk(b'acTL', struct.pack(">LL", frames, 0))
+    data += png_chunk(b'fcTL', b'\0' * 26) + png_chunk(b'IDAT', b'first')
+    for i in range(1, frames):
+        data += png_chunk(b'fcTL', b'\0' * 26) + png_chunk(b'fdAT', struct.pack(">L", i) + b'next')
+    return data + png_chunk(b'IEND', b'')
+
+
+def webp_chunk(fourcc, data):
+    return fourcc + struct.pack("<L", len(data)) + data + b'\0' * (len(data) & 1)
+
+
+def anmf(width, height, body):
+    header = b'\0' * 6 + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little") + b'\x64\0\0\0'
+    return webp_chunk(b'ANMF', header + body)
+
+
+def webp(chunks):
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack("<L", len(body)) + body
+
+
+class Test_animation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.out = osp.join(self.directory, "out")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = osp.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def read_out(self):
+        with open(self.out, "rb") as f:
+            return f.read()
+
+    def test_gif_frame_count(self):
+        self.assertEqual(frame_count(self.write("a.gif", gif(3))), 3)
+        self.assertEqual(frame_count(self.write("b.gif", gif(1))), 1)
+
+    def test_gif_first_frame(self):
+        path = self.write("a.gif", gif(3))
+        self.assertTrue(extract_first_frame(path, self.out))
+        self.assertEqual(self.read_out(), gif(1))
+
+    def test_truncated_gif(self):
+        path = self.write("a.gif", gif(2)[:-8])
+        self.assertEqual(frame_count(path), 1)
+        self.assertTrue(extract_first_frame(path, self.out))
+        self.assertEqual(frame_count(self.out), 1)
+
+    def test_apng_frame_count(self):
+        self.assertEqual(frame_count(self.write("a.png", apng(4))), 4)
+
+    def test_png_frame_count(self):
+        png = PNG_SIGNATURE + png_chunk(b'IHDR', b'\0' * 13) + png_chunk(b'IDAT', b'') + png_chunk(b'IEND', b'')
+        self.assertEqual(frame_count(self.write("a.png", png)), 1)
+
+    def test_apng_first_frame(self):
+        self.assertTrue(extract_first_frame(self.write("a.png", apng(3)), self.out))
+        still = self.read_out()
+        self.assertEqual(still, PNG_SIGNATURE + png_chunk(b'IHDR', struct.pack(">LLBBBBB", 2, 3, 8, 6, 0, 0, 0)) +
+                         png_chunk(b'IDAT', b'first') + png_chunk(b'IEND', b''))
+        self.assertEqual(frame_count(self.out), 1)
+
+    def test_webp_frame_count(self):
+        frames = [anmf(4, 5, webp_chunk(b'VP8L', b'frame%d' % i)) for i in range(3)]
+        path = self.write("a.webp", webp([webp_chunk(b'VP8X', b'\x02' + b'\0' * 9), webp_chunk(b'ANIM', b'\0' * 6)] +
+                                         frames))
+        self.assertEqual(frame_count(path), 3)
+
+    def test_webp_first_frame(self):
+        frames = [anmf(4, 5, webp_chunk(b'VP8L', b'first')), anmf(4, 5, webp_chunk(b'VP8L', b'second'))]
+        path = self.write("a.webp", webp([webp_chunk(b'VP8X', b'\x02' + b'\0' * 9)] + frames))
+        self.assertTrue(extract_first_frame(path, self.out))
+        self.assertEqual(self.read_out(), webp([webp_chunk(b'VP8L', b'first')]))
+
+    def test_webp_first_frame_with_alpha(self):
+        body = webp_chunk(b'ALPH', b'alpha') + webp_chunk(b'VP8 ', b'lossy!')
+        path = self.write("a.webp", webp([webp_chunk(b'VP8X', b'\x12' + b'\0' * 9), anmf(300, 2, body)]))
+        self.assertTrue(extract_first_frame(path, self.out))
+        vp8x = webp_chunk(b'VP8X', b'\x10\0\0\0' + (299).to_bytes(3, "little") + (1).to_bytes(3, "little"))
+        self.assertEqual(self.read_out(), webp([vp8x, body]))
+
+    def test_unknown_format(self):
+        path = self.write("a.txt", b'not an image')
+        self.assertEqual(frame_count(path), 1)
+        self.assertFalse(extract_first_frame(path, self.out))
+        self.assertFalse(os.path.exists(self.out))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import re
+import shutil
+import threading
+import zipfile
+from collections import OrderedDict
+
+from .get_image_size import get_image_metadata_from_bytesio, Image
+
+try:
+    from typing import Callable, Optional, Tuple
+    assert Callable and Optional and Tuple
+except ImportError:
+    pass
+
+
+# zip based formats whose members can be previewed
+ARCHIVE_EXTENSIONS = ("zip", "jar", "war", "apk", "cbz", "epub", "docx", "xlsx", "pptx", "odt", "ods", "odp")
+MEMBER_RE = re.compile(r"^(.+?\.(?:%s))[\\/](.+)$" % "|".join(ARCHIVE_EXTENSIONS), re.IGNORECASE)
+
+
+def split_member(path: str) -> 'Optional[Tuple[str, str]]':
+    """Return the (archive, member) of a path like `assets.zip/icons/logo.png`."""
+
+    match = MEMBER_RE.match(path)
+    if not match:
+        return None
+    # members always use forward slashes
+    return match.group(1), match.group(2).replace("\\", "/")
+
+
+def find_member(path: str, resolve: 'Callable[[str], str]') -> 'Optional[Tuple[str, str]]':
+    """
+    Return the (archive file, member) of a path like `assets.zip/icons/logo.png`
+    if its archive part, found with `resolve`, is an existing file.
+
+    Only the archive is looked for, so a file of the same name as the member
+    elsewhere doesn't hide it and its name isn't searched.
+    """
+
+    member = split_member(path)
+    if not member:
+        return None
+    archive = resolve(member[0])
+    if not archive or not os.path.isfile(archive):
+        return None
+    return archive, member[1]
+
+
+class Archives:
+    """
+    Open archives cached by (path, mtime).
+
+    `zipfile` parses the central directory once when an archive is opened,
+    after that any member is found with a dict lookup and read from its
+    offset, so hovering into a large archive only reads the hovered member.
+    """
+
+    def __init__(self, max_open: int = 8):
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        # path -> (mtime, archive), least recently used first
+        self.open_archives = OrderedDict()  # type: OrderedDict
+
+    def get(self, path: str) -> zipfile.ZipFile:
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.open_archives.pop(path, None)
+            if cached and cached[0] == mtime:
+                self.open_archives[path] = cached
+                return cached[1]
+            if cached:
+                cached[1].close()
+
+            archive = zipfile.ZipFile(path)
+            self.open_archives[path] = mtime, archive
+            while len(self.open_archives) > self.max_open:
+                self.open_archives.popitem(last=False)[1][1].close()
+            return archive
+
+    def metadata(self, path: str, member: str) -> Image:
+        """Return the `Image` of `member`, decompressing only its first bytes."""
+
+        archive = self.get(path)
+        info = archive.getinfo(member)
+        with archive.open(info) as f:
+            return get_image_metadata_from_bytesio(f, info.file_size, path + "/" + member)
+
+    def extract(self, path: str, member: str, out: str):
+        with self.get(path).open(member) as src, open(out, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+    def close(self):
+        with self.lock:
+            for mtime, archive in self.open_archives.values():
+                archive.close()
+            self.open_archives.clear()
@@ -0,0 +1,139 @@
+import os
+import os.path as osp
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+from utils.archive import Archives, find_member, split_member
+from utils.get_image_size import UnknownImageFormat
+
+
+def png(width, height):
+    """The start of a PNG, enough for its dimensions to be read."""
+
+    return b'\211PNG\r\n\032\n' + struct.pack(">L", 13) + b'IHDR' + struct.pack(">LL", width, height) + b'\0' * 9
+
+
+class Test_split_member(unittest.TestCase):
+
+    def test_member(self):
+        self.assertEqual(split_member("assets.zip/icons/logo.png"), ("assets.zip", "icons/logo.png"))
+        self.assertEqual(split_member("C:\\docs\\report.DOCX\\word\\media\\image1.png"),
+                         ("C:\\docs\\report.DOCX", "word/media/image1.png"))
+
+    def test_not_a_member(self):
+        self.assertIsNone(split_member("icons/logo.png"))
+        self.assertIsNone(split_member("assets.zip"))
+        self.assertIsNone(split_member("assets.zipper/logo.png"))
+
+
+class Test_find_member(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.searched = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def resolve(self, path):
+        """Find a file by its name anywhere in the project, like the recursive search mode."""
+
+        self.searched.append(path)
+        for root, dirs, files in os.walk(self.directory):
+            if osp.basename(path) in files:
+                return osp.join(root, osp.basename(path))
+        return ""
+
+    def test_member_with_a_file_of_the_same_name(self):
+        os.makedirs(osp.join(self.directory, "src"))
+        with open(osp.join(self.directory, "src", "logo.png"), "wb") as f:
+            f.write(png(999, 999))
+        path = osp.join(self.directory, "assets.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("icons/logo.png", png(10, 20))
+
+        self.assertEqual(find_member("assets.zip/icons/logo.png", self.resolve), (path, "icons/logo.png"))
+        # only the archive is looked for
+        self.assertEqual(self.searched, ["assets.zip"])
+        archives = Archives()
+        image = archives.metadata(path, "icons/logo.png")
+        archives.close()
+        self.assertEqual((image.width, image.height), (10, 20))
+
+    def test_missing_archive(self):
+        self.assertIsNone(find_member("assets.zip/icons/logo.png", self.resolve))
+        self.assertIsNone(find_member("icons/logo.png", self.resolve))
+        self.assertEqual(self.searched, ["assets.zip"])
+
+
+class Test_Archives(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archives = Archives(max_open=2)
+
+    def tearDown(self):
+        self.archives.close()
+        shutil.rmtree(self.directory)
+
+    def make(self, name, members):
+        path = osp.join(self.directory, name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for member, data in members.items():
+                archive.writestr(member, data)
+        return path
+
+    def test_metadata(self):
+        path = self.make("a.zip", {"icons/logo.png": png(12, 34) + b'\0' * 1000})
+        image = self.archives.metadata(path, "icons/logo.png")
+        self.assertEqual((image.width, image.height, image.type), (12, 34, "PNG"))
+        self.assertEqual(image.file_size, len(png(12, 34)) + 1000)
+        self.assertEqual(image.path, path + "/icons/logo.png")
+
+    def test_missing_member(self):
+        path = self.make("a.zip", {"logo.png": png(1, 1)})
+        with self.assertRaises(KeyError):
+            self.archives.metadata(path, "other.png")
+
+    def test_not_an_image(self):
+        path = self.make("a.zip", {"logo.png": b'not an image'})
+        with self.assertRaises(UnknownImageFormat):
+            self.archives.metadata(path, "logo.png")
+
+    def test_extract(self):
+        data = png(5, 5) + os.urandom(4096)
+        path = self.make("a.cbz", {"pages/1.png": data})
+        out = osp.join(self.directory, "out.png")
+        self.archives.extract(path, "pages/1.png", out)
+        with open(out, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_modified_archive_is_opened_again(self):
+        path = self.make("a.zip", {"logo.png": png(1, 2)})
+        self.assertEqual(self.archives.metadata(path, "logo.png").height, 2)
+        first = self.archives.get(path)
+        self.make("a.zip", {"logo.png": png(1, 3)})
+        # make sure the modification time changes on file systems with a coarse resolution
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.archives.metadata(path, "logo.png").height, 3)
+        self.assertIsNot(self.archives.get(path), first)
+        self.assertIsNone(first.fp)
+
+    def test_least_recently_used_archive_is_closed(self):
+        paths = [self.make("%d.zip" % i, {"logo.png": png(i + 1, 1)}) for i in range(3)]
+        first = self.archives.get(paths[0])
+        second = self.archives.get(paths[1])
+        # used again, the second one is now the least recently used
+        self.archives.get(paths[0])
+        self.archives.get(paths[2])
+        self.assertIsNotNone(first.fp)
+        self.assertIsNone(second.fp)
+        self.assertEqual(self.archives.metadata(paths[1], "logo.png").width, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
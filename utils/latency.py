@@ -0,0 +1,53 @@
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from typing import Dict, List, Tuple
+    assert Dict and List and Tuple
+except ImportError:
+    pass
+
+
+# stage -> [number of previews it made miss their budget, worst duration in ms]
+slow_stages = {}  # type: Dict[str, List[float]]
+slow_stages_lock = threading.Lock()
+
+
+class LatencyBudget:
+    """The time a preview has to show up, and how it was spent."""
+
+    def __init__(self, budget: float):
+        # in milliseconds, 0 means no budget
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.stages = []  # type: List[Tuple[str, float]]
+
+    def elapsed(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block, recording it in `slow_stages` if the budget ran out during it."""
+
+        begin = self.elapsed()
+        try:
+            yield
+        finally:
+            end = self.elapsed()
+            self.stages.append((name, end - begin))
+            if self.budget > 0 and begin <= self.budget < end:
+                with slow_stages_lock:
+                    record = slow_stages.setdefault(name, [0, 0.0])
+                    record[0] += 1
+                    record[1] = max(record[1], end - begin)
+
+
+def report() -> str:
+    """Return a description of the stages that made previews miss their budget, worst first."""
+
+    with slow_stages_lock:
+        records = sorted(slow_stages.items(), key=lambda item: -item[1][0])
+    if not records:
+        return "No preview missed its latency budget."
+    return "\n".join("%-12s %5d times, worst %.0fms" % (name, count, worst) for name, (count, worst) in records)
@@ -0,0 +1,51 @@
+import binascii
+import os
+
+# a multiple of 3 so that every chunk but the last encodes without padding
+CHUNK_SIZE = 3 << 18
+
+
+def encoded_size(size: int) -> int:
+    """Return the length of the base64 encoding of `size` bytes."""
+
+    return 4 * ((size + 2) // 3)
+
+
+def encode_file(path: str, head: str, tail: str) -> str:
+    """
+    Return `head` + the base64 encoded content of `path` + `tail`.
+
+    The file is read and encoded chunk by chunk into a single preallocated
+    buffer, which is decoded once into the returned string, so only the
+    buffer and the string (about 2.7 times the file size) are alive at the
+    same time, never the raw content.
+    """
+
+    size = os.path.getsize(path)
+    head_bytes = head.encode("ascii")
+    tail_bytes = tail.encode("ascii")
+    start = len(head_bytes)
+    end = start + encoded_size(size)
+    buf = bytearray(end + len(tail_bytes))
+    buf[:start] = head_bytes
+
+    chunk = bytearray(CHUNK_SIZE)
+    pos = start
+    left = size
+    with open(path, "rb") as f, memoryview(chunk) as view:
+        while left:
+            # fill the whole chunk, a short read would add padding in the middle of the payload
+            filled = 0
+            while filled < min(CHUNK_SIZE, left):
+                n = f.readinto(view[filled:min(CHUNK_SIZE, left)])
+                if not n:
+                    raise OSError("%s changed while being read" % path)
+                filled += n
+            encoded = binascii.b2a_base64(view[:filled], newline=False)
+            buf[pos:pos + len(encoded)] = encoded
+            pos += len(encoded)
+            left -= filled
+
+    buf[end:] = tail_bytes
+    del chunk
+    return buf.decode("ascii")
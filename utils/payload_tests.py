@@ -0,0 +1,44 @@
+import base64
+import os
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+from utils.payload import CHUNK_SIZE, encode_file, encoded_size
+
+
+class Test_encode_file(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, size):
+        data = os.urandom(size)
+        path = osp.join(self.directory, "%d.bin" % size)
+        with open(path, "wb") as f:
+            f.write(data)
+        expected = "<head>" + base64.b64encode(data).decode("ascii") + "<tail>"
+        self.assertEqual(encode_file(path, "<head>", "<tail>"), expected)
+        self.assertEqual(encoded_size(size), len(base64.b64encode(data)))
+
+    def test_empty(self):
+        self.check(0)
+
+    def test_one_byte(self):
+        self.check(1)
+
+    def test_around_a_chunk(self):
+        for size in (CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1):
+            with self.subTest(size=size):
+                self.check(size)
+
+    def test_several_chunks(self):
+        self.check(3 * CHUNK_SIZE + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import cProfile
+import io
+import json
+import os
+import os.path as osp
+import pstats
+import time
+from contextlib import contextmanager
+
+try:
+    from typing import Callable, Optional
+    assert Callable and Optional
+except ImportError:
+    pass
+
+
+@contextmanager
+def profiled(directory: str, threshold: float, keep: int, tags: 'Callable[[], dict]'):
+    """
+    Profile the enclosed block and keep its stats if it took more than `threshold` milliseconds.
+
+    The stats are dumped in `directory` next to a JSON file holding `tags()`,
+    only the `keep` most recent profiles are kept.
+    """
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed > threshold:
+            save(profiler, directory, keep, dict(tags(), elapsed=elapsed))
+
+
+def save(profiler: cProfile.Profile, directory: str, keep: int, tags: dict):
+    if not osp.isdir(directory):
+        os.makedirs(directory)
+    now = time.time()
+    # sorted by date when sorted by name
+    name = "%s-%03d-%s" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(now)), now * 1000 % 1000,
+                           tags.get("kind", ""))
+    profiler.dump_stats(osp.join(directory, name + ".pstats"))
+    with open(osp.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(tags, f, indent=4, default=str)
+
+    for old in profiles(directory)[:-keep or None]:
+        for ext in (".pstats", ".json"):
+            if osp.exists(old + ext):
+                os.remove(old + ext)
+
+
+def profiles(directory: str) -> list:
+    """Return the paths (without extension) of the profiles in `directory`, oldest first."""
+
+    if not osp.isdir(directory):
+        return []
+    return sorted(osp.join(directory, f[:-len(".pstats")]) for f in os.listdir(directory) if f.endswith(".pstats"))
+
+
+def latest_summary(directory: str, limit: int = 40) -> 'Optional[str]':
+    """Return the tags and the most expensive calls of the latest profile."""
+
+    paths = profiles(directory)
+    if not paths:
+        return None
+    latest = paths[-1]
+
+    out = io.StringIO()
+    out.write(latest + ".pstats\n\n")
+    if osp.exists(latest + ".json"):
+        with open(latest + ".json", encoding="utf-8") as f:
+            out.write(f.read() + "\n\n")
+    pstats.Stats(latest + ".pstats", stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
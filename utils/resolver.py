@@ -0,0 +1,80 @@
+import os
+import os.path as osp
+import stat
+import threading
+
+try:
+    from typing import Dict, List, Optional, Sequence, Tuple
+    assert Dict and List and Optional and Sequence and Tuple
+except ImportError:
+    pass
+
+
+class AssetResolver:
+    """
+    Resolve the image paths of a web project, e.g `/img/logo.png` against its
+    asset roots (`public/`, `static/`...) or `@/assets/logo.png` against its
+    aliases.
+
+    The candidate directories are computed once, they're tried in a fixed
+    order: the aliases (longest prefix first, matching whole path
+    components) or the asset roots in their order, each in the order of the
+    project folders. The files found are cached, a cached file is still
+    checked with a stat of it and of the candidates before it, so that it's
+    replaced if it's removed or if one of them appears.
+    """
+
+    def __init__(self, folders: 'Sequence[str]', roots: 'Sequence[str]', aliases: 'Dict[str, str]'):
+        # (directory, project folder it's in)
+        self.roots = [(osp.normpath(osp.join(folder, root)), folder) for root in roots for folder in folders]
+        # (prefix, [(directory, project folder it's in)])
+        self.aliases = []  # type: List[Tuple[str, List[Tuple[str, Optional[str]]]]]
+        for prefix in sorted(aliases, key=len, reverse=True):
+            target = osp.expanduser(aliases[prefix])
+            if osp.isabs(target):
+                directories = [(osp.normpath(target), None)]  # type: List[Tuple[str, Optional[str]]]
+            else:
+                directories = [(osp.normpath(osp.join(folder, target)), folder) for folder in folders]
+            self.aliases.append((prefix, directories))
+        self.lock = threading.Lock()
+        # path -> (candidate index, file, project folder it's in)
+        self.resolved = {}  # type: Dict[str, Tuple[int, str, Optional[str]]]
+
+    def candidates(self, path: str) -> 'List[Tuple[str, Optional[str]]]':
+        for prefix, directories in self.aliases:
+            rest = path[len(prefix):]
+            # whole path components only, "@" doesn't match "@scope/pkg/logo.png"
+            if path.startswith(prefix) and (prefix.endswith(("/", "\\")) or rest.startswith(("/", "\\"))):
+                break
+        else:
+            if not path.startswith(("/", "\\")):
+                return []
+            rest, directories = path, self.roots
+        rest = rest.lstrip("/\\")
+        return [(osp.join(directory, rest), folder) for directory, folder in directories]
+
+    def resolve(self, path: str) -> 'Optional[Tuple[str, Optional[str]]]':
+        """Return the file `path` refers to and the project folder it's in, None if it's not found."""
+
+        with self.lock:
+            cached = self.resolved.get(path)
+        candidates = self.candidates(path)
+        if cached:
+            index, file, folder = cached
+            # still there and still the first one
+            if is_file(file) and not any(is_file(earlier) for earlier, _ in candidates[:index]):
+                return file, folder
+
+        for index, (file, folder) in enumerate(candidates):
+            if is_file(file):
+                with self.lock:
+                    self.resolved[path] = index, file, folder
+                return file, folder
+        return None
+
+
+def is_file(path: str) -> bool:
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except OSError:
+        return False
@@ -0,0 +1,74 @@
+import os
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+from utils.resolver import AssetResolver
+
+
+class Test_AssetResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.folders = [osp.join(self.directory, "one"), osp.join(self.directory, "two")]
+        for folder in self.folders:
+            os.makedirs(folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def touch(self, *parts):
+        path = osp.join(self.directory, *parts)
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        open(path, "w").close()
+        return path
+
+    def test_asset_roots_in_order(self):
+        resolver = AssetResolver(self.folders, ["public", "static"], {})
+        static = self.touch("one", "static", "img", "logo.png")
+        self.assertEqual(resolver.resolve("/img/logo.png"), (static, self.folders[0]))
+        public = self.touch("two", "public", "img", "logo.png")
+        # the roots come first, then the folders
+        self.assertEqual(resolver.resolve("/img/logo.png"), (public, self.folders[1]))
+        self.assertIsNone(resolver.resolve("img/logo.png"))
+
+    def test_earlier_candidates_are_checked_again(self):
+        resolver = AssetResolver(self.folders, ["public"], {})
+        second = self.touch("two", "public", "logo.png")
+        self.assertEqual(resolver.resolve("/logo.png"), (second, self.folders[1]))
+        # a file of a higher priority appears
+        first = self.touch("one", "public", "logo.png")
+        self.assertEqual(resolver.resolve("/logo.png"), (first, self.folders[0]))
+        # and disappears
+        os.remove(first)
+        self.assertEqual(resolver.resolve("/logo.png"), (second, self.folders[1]))
+        os.remove(second)
+        self.assertIsNone(resolver.resolve("/logo.png"))
+
+    def test_alias_matches_whole_components(self):
+        resolver = AssetResolver(self.folders[:1], [], {"@": "src", "~assets/": "assets"})
+        logo = self.touch("one", "src", "logo.png")
+        self.assertEqual(resolver.resolve("@/logo.png"), (logo, self.folders[0]))
+        self.assertEqual(resolver.resolve("@\\logo.png"), (logo, self.folders[0]))
+        self.assertEqual(resolver.candidates("@scope/pkg/logo.png"), [])
+        self.assertEqual(resolver.candidates("@logo.png"), [])
+        # a prefix ending with a separator
+        icon = self.touch("one", "assets", "icon.png")
+        self.assertEqual(resolver.resolve("~assets/icon.png"), (icon, self.folders[0]))
+
+    def test_longest_alias_first(self):
+        resolver = AssetResolver(self.folders[:1], [], {"@": "src", "@/assets": "static"})
+        self.touch("one", "src", "assets", "logo.png")
+        logo = self.touch("one", "static", "logo.png")
+        self.assertEqual(resolver.resolve("@/assets/logo.png"), (logo, self.folders[0]))
+
+    def test_absolute_alias(self):
+        target = osp.join(self.directory, "shared")
+        logo = self.touch("shared", "logo.png")
+        resolver = AssetResolver(self.folders, [], {"@shared": target})
+        self.assertEqual(resolver.resolve("@shared/logo.png"), (logo, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,22 @@ class Settings:
     recursive = True
     image_folder_name = "__previewed_images__"
     formats_to_convert = ["svg", "svgz", "ico", "webp"]
+    thumbnail_pack = False
+    max_thumbnail_pack_size = 100
+    max_parallel_downloads = 8
+    max_preview_size = 20
+    latency_budget = 300
+    inline_thumbnails = False
+    inline_thumbnail_size = 32
+    max_inline_thumbnails = 100
+    max_inline_thumbnails_size = 2
+    profile_slow_previews = False
+    slow_preview_threshold = 1000
+    max_profiles = 20
+    url_mirrors = []  # type: list
+    downloaded_images_lifetime = 600
+    asset_roots = []  # type: list
+    path_aliases = {}  # type: dict
 
     @classmethod
     def update(cls, loaded_settings):
@@ -14,3 +30,19 @@ class Settings:
         cls.recursive = loaded_settings.get("recursive", True)
         cls.image_folder_name = loaded_settings.get("image_folder_name", "__previewed_images__")
         cls.formats_to_convert = loaded_settings.get("formats_to_convert", ["svg", "svgz", "ico", "webp"])
+        cls.thumbnail_pack = loaded_settings.get("thumbnail_pack", False)
+        cls.max_thumbnail_pack_size = loaded_settings.get("max_thumbnail_pack_size", 100)
+        cls.max_parallel_downloads = loaded_settings.get("max_parallel_downloads", 8)
+        cls.max_preview_size = loaded_settings.get("max_preview_size", 20)
+        cls.latency_budget = loaded_settings.get("latency_budget", 300)
+        cls.inline_thumbnails = loaded_settings.get("inline_thumbnails", False)
+        cls.inline_thumbnail_size = loaded_settings.get("inline_thumbnail_size", 32)
+        cls.max_inline_thumbnails = loaded_settings.get("max_inline_thumbnails", 100)
+        cls.max_inline_thumbnails_size = loaded_settings.get("max_inline_thumbnails_size", 2)
+        cls.profile_slow_previews = loaded_settings.get("profile_slow_previews", False)
+        cls.slow_preview_threshold = loaded_settings.get("slow_preview_threshold", 1000)
+        cls.max_profiles = loaded_settings.get("max_profiles", 20)
+        cls.url_mirrors = loaded_settings.get("url_mirrors", [])
+        cls.downloaded_images_lifetime = loaded_settings.get("downloaded_images_lifetime", 600)
+        cls.asset_roots = loaded_settings.get("asset_roots", [])
+        cls.path_aliases = loaded_settings.get("path_aliases", {})
@@ -0,0 +1,291 @@
+import json
+import mmap
+import os
+import os.path as osp
+import re
+import threading
+from collections import namedtuple, OrderedDict
+
+try:
+    from typing import Dict, List, Optional
+    assert Dict and List and Optional
+except ImportError:
+    pass
+
+
+# maximum dimension (in pixels) of each pre-encoded thumbnail level
+LEVELS = (64, 128, 256, 512, 1024)
+# maximum size (in bytes) of a thumbnail before its base64 encoding
+MAX_ENTRY_SIZE = 1 << 20
+
+Entry = namedtuple("Entry", ["path", "stamp", "level", "offset", "length", "fmt",
+                             "width", "height", "real_width", "real_height", "file_size", "full", "frames"])
+# records written before animations were supported have no frame count
+Entry.__new__.__defaults__ = (1,)
+
+
+def file_stamp(path: str) -> str:
+    """Return a string that changes whenever the file at `path` is modified."""
+
+    st = os.stat(path)
+    return "%d:%d" % (st.st_mtime_ns, st.st_size)
+
+
+class ThumbnailPack:
+    """
+    An append-only store of base64 encoded thumbnails.
+
+    Thumbnails live in a single `.pack` file (concatenated base64 payloads)
+    described by a `.idx` file (one JSON record per line). Payloads are read
+    through `mmap` so only the requested slice is ever copied.
+
+    Once the thumbnails take more than `max_size` bytes, the ones of the
+    least recently read files are evicted. Superseded and evicted records
+    are dropped by `compact()`, so the pack can grow up to about twice
+    `max_size` in between.
+
+    Compacting writes a pack of the next generation, the index names the
+    generation of its pack in its first line. Replacing the index is the
+    only step switching to the new pack, so a crash can't leave an index
+    describing the other pack.
+    """
+
+    def __init__(self, directory: str, name: str = "thumbnails", max_size: int = 0):
+        if not osp.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.name = name
+        self.index_path = osp.join(directory, name + ".idx")
+        # set by `_open` from the index
+        self.generation = 0
+        self.pack_path = self._pack_path(0)
+        # 0 for no limit
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._compacting = False
+        # path -> {level: Entry}, only entries of the latest stamp are kept, least recently used first
+        self._index = OrderedDict()  # type: OrderedDict
+        self._live_bytes = 0
+        self._dead_bytes = 0
+        self._pack = None
+        self._idx = None
+        self._mm = None  # type: Optional[mmap.mmap]
+        self._open()
+        self._remove_stale()
+
+    def _pack_path(self, generation: int) -> str:
+        if not generation:
+            return osp.join(self.directory, self.name + ".pack")
+        return osp.join(self.directory, "%s.%d.pack" % (self.name, generation))
+
+    def _open(self):
+        self._idx = open(self.index_path, "a", encoding="utf-8")
+        self._index = OrderedDict()
+        self._live_bytes = 0
+        self._dead_bytes = 0
+        with open(self.index_path, encoding="utf-8") as idx:
+            try:
+                self.generation = json.loads(idx.readline())["generation"]
+            except (ValueError, TypeError, KeyError):
+                # never compacted
+                self.generation = 0
+                idx.seek(0)
+            self.pack_path = self._pack_path(self.generation)
+            self._pack = open(self.pack_path, "ab")
+            pack_size = osp.getsize(self.pack_path)
+            line = "\n"
+            for line in idx:
+                try:
+                    record = json.loads(line)
+                    if "evicted" in record:
+                        self._drop(record["evicted"])
+                        continue
+                    entry = Entry(**record)
+                except (ValueError, TypeError):
+                    # a truncated last line after a crash
+                    continue
+                if entry.offset + entry.length > pack_size:
+                    continue
+                self._add(entry)
+        if not line.endswith("\n"):
+            # end the truncated line, or the next record would be appended to it
+            self._idx.write("\n")
+            self._idx.flush()
+        self._remap()
+
+    def _remove_stale(self):
+        """Remove the packs of the other generations and what an interrupted compaction left."""
+
+        stale = re.compile(r"%s(\.\d+)?\.pack(\.tmp)?$|%s\.idx\.tmp$" % (re.escape(self.name), re.escape(self.name)))
+        for f in os.listdir(self.directory):
+            if stale.match(f) and f != osp.basename(self.pack_path):
+                try:
+                    os.remove(osp.join(self.directory, f))
+                except OSError:
+                    # still open on Windows, removed next time
+                    pass
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        for f in (self._pack, self._idx):
+            if f is not None:
+                f.close()
+        self._pack = self._idx = None
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        # an empty file can't be mapped
+        if osp.getsize(self.pack_path):
+            with open(self.pack_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _add(self, entry: Entry):
+        levels = self._index.get(entry.path)
+        if levels:
+            old = next(iter(levels.values()))
+            if old.stamp != entry.stamp:
+                # the file changed, all the previous thumbnails are stale
+                self._drop(entry.path)
+            elif entry.level in levels:
+                self._dead_bytes += levels[entry.level].length
+                self._live_bytes -= levels[entry.level].length
+        self._index.setdefault(entry.path, {})[entry.level] = entry
+        self._index.move_to_end(entry.path)
+        self._live_bytes += entry.length
+
+    def _drop(self, path: str):
+        length = sum(e.length for e in self._index.pop(path, {}).values())
+        self._dead_bytes += length
+        self._live_bytes -= length
+
+    def _evict(self):
+        """Drop the thumbnails of the least recently used files until the pack fits in `max_size`."""
+
+        # the latest file is kept even if it doesn't fit on its own
+        while self.max_size and self._live_bytes > self.max_size and len(self._index) > 1:
+            path = next(iter(self._index))
+            self._drop(path)
+            self._idx.write(json.dumps({"evicted": path}) + "\n")
+        self._idx.flush()
+
+    def entries(self, path: str, stamp: str) -> 'List[Entry]':
+        """Return the thumbnails of `path` sorted by level, if they are up to date."""
+
+        with self._lock:
+            levels = self._index.get(path)
+            if not levels:
+                return []
+            entries = sorted(levels.values(), key=lambda e: e.level)
+        if entries[0].stamp != stamp:
+            return []
+        return entries
+
+    def read(self, entry: Entry) -> 'Optional[str]':
+        """Return the base64 payload of `entry`."""
+
+        with self._lock:
+            # offsets change when the pack is compacted, look the entry up again
+            current = self._index.get(entry.path, {}).get(entry.level)
+            if current is None or current.stamp != entry.stamp:
+                return None
+            self._index.move_to_end(entry.path)
+            if self._mm is None or current.offset + current.length > len(self._mm):
+                self._remap()
+            if self._mm is None:
+                return None
+            with memoryview(self._mm) as mv, mv[current.offset:current.offset + current.length] as payload:
+                return str(payload, "ascii")
+
+    def append(self, path: str, stamp: str, level: int, fmt: str, width: int, height: int,
+               real_width: int, real_height: int, file_size: int, full: bool, payload: bytes, frames: int = 1):
+        """Append a base64 encoded thumbnail of `path` to the pack."""
+
+        with self._lock:
+            self._pack.seek(0, os.SEEK_END)
+            offset = self._pack.tell()
+            self._pack.write(payload)
+            self._pack.flush()
+            entry = Entry(path, stamp, level, offset, len(payload), fmt,
+                          width, height, real_width, real_height, file_size, full, frames)
+            self._idx.write(json.dumps(entry._asdict()) + "\n")
+            self._idx.flush()
+            self._add(entry)
+            self._evict()
+
+    def needs_compaction(self) -> bool:
+        with self._lock:
+            size = self._pack.tell() if self._pack else 0
+            return not self._compacting and self._dead_bytes > 1 << 20 and self._dead_bytes > size // 2
+
+    def compact(self):
+        """Rewrite the pack without the superseded and evicted thumbnails."""
+
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            live = [e for levels in self._index.values() for e in levels.values()]
+            end = self._pack.tell()
+            generation = self.generation + 1
+
+        index_tmp = self.index_path + ".tmp"
+        try:
+            # copy through a private handle so readers keep using the current map
+            with open(self.pack_path, "rb") as src:
+                pack = open(self._pack_path(generation), "wb")
+                idx = open(index_tmp, "w", encoding="utf-8")
+                try:
+                    idx.write(json.dumps({"generation": generation}) + "\n")
+                    self._copy(live, src, pack, idx)
+                    with self._lock:
+                        # pick up what was appended while copying
+                        late = [e for levels in self._index.values() for e in levels.values()
+                                if e.offset >= end]
+                        self._copy(late, src, pack, idx)
+                        # the new pack must be complete before the index refers to it
+                        for f in (pack, idx):
+                            f.flush()
+                            os.fsync(f.fileno())
+                            f.close()
+                        order = list(self._index)
+                        self._close()
+                        try:
+                            os.replace(index_tmp, self.index_path)
+                        finally:
+                            # the new index and pack, or the old ones if it failed
+                            self._open()
+                        self._restore(order)
+                finally:
+                    pack.close()
+                    idx.close()
+        finally:
+            with self._lock:
+                self._compacting = False
+                # the old pack, or the new one if it failed
+                self._remove_stale()
+
+    def _restore(self, order: 'List[str]'):
+        """Put back the usage order of the files, evicting again the ones evicted while compacting."""
+
+        kept = set(order)
+        for path in [path for path in self._index if path not in kept]:
+            self._drop(path)
+            self._idx.write(json.dumps({"evicted": path}) + "\n")
+        self._idx.flush()
+        self._index = OrderedDict((path, self._index[path]) for path in order if path in self._index)
+
+    @staticmethod
+    def _copy(entries, src, pack, idx):
+        for entry in entries:
+            src.seek(entry.offset)
+            data = src.read(entry.length)
+            idx.write(json.dumps(entry._replace(offset=pack.tell())._asdict()) + "\n")
+            pack.write(data)
+
+    def close(self):
+        with self._lock:
+            self._close()
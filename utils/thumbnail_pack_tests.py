@@ -0,0 +1,184 @@
+import base64
+import os
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.thumbnail_pack import file_stamp, ThumbnailPack
+
+
+def payload(seed, length=100):
+    return base64.b64encode(bytes([seed]) * length)
+
+
+class Test_ThumbnailPack(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pack = ThumbnailPack(self.directory)
+
+    def tearDown(self):
+        self.pack.close()
+        shutil.rmtree(self.directory)
+
+    def append(self, path, stamp="1:1", level=64, seed=0, length=100, pack=None):
+        (pack or self.pack).append(path, stamp, level, "png", level, level // 2, 1000, 500, 4096, False,
+                                   payload(seed, length))
+
+    def reopen(self, **kwargs):
+        self.pack.close()
+        self.pack = ThumbnailPack(self.directory, **kwargs)
+
+    def read(self, path, stamp="1:1"):
+        return [self.pack.read(entry) for entry in self.pack.entries(path, stamp)]
+
+    def fill(self):
+        for seed in range(10):
+            self.append("a.png", seed=seed, length=300 * 1024)
+        self.append("b.png", seed=42)
+
+    def test_append_and_read(self):
+        self.append("a.png", level=128, seed=2)
+        self.append("a.png", level=64, seed=1)
+        entries = self.pack.entries("a.png", "1:1")
+        self.assertEqual([entry.level for entry in entries], [64, 128])
+        self.assertEqual((entries[0].width, entries[0].height, entries[0].frames), (64, 32, 1))
+        self.assertEqual(self.read("a.png"), [payload(1).decode(), payload(2).decode()])
+        self.assertEqual(self.pack.entries("b.png", "1:1"), [])
+
+    def test_reopen(self):
+        self.append("a.png", seed=1)
+        self.append("b.png", seed=2)
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(1).decode()])
+        self.assertEqual(self.read("b.png"), [payload(2).decode()])
+
+    def test_stale_stamp(self):
+        self.append("a.png", stamp="1:1", level=64)
+        self.append("a.png", stamp="1:1", level=128)
+        self.append("a.png", stamp="2:1", level=256, seed=3)
+        self.assertEqual(self.pack.entries("a.png", "1:1"), [])
+        self.assertEqual(self.read("a.png", "2:1"), [payload(3).decode()])
+
+    def test_read_superseded_entry(self):
+        self.append("a.png", stamp="1:1")
+        entry = self.pack.entries("a.png", "1:1")[0]
+        self.append("a.png", stamp="2:1")
+        self.assertIsNone(self.pack.read(entry))
+
+    def test_compact(self):
+        self.fill()
+        self.assertTrue(self.pack.needs_compaction())
+        entry = self.pack.entries("b.png", "1:1")[0]
+        self.pack.compact()
+        self.assertFalse(self.pack.needs_compaction())
+        self.assertLess(osp.getsize(self.pack.pack_path), 2 * len(payload(0, 300 * 1024)))
+        # an entry found before compacting is still readable
+        self.assertEqual(self.pack.read(entry), payload(42).decode())
+        self.assertEqual(self.read("a.png"), [payload(9, 300 * 1024).decode()])
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(9, 300 * 1024).decode()])
+        self.assertEqual(self.read("b.png"), [payload(42).decode()])
+        # only the index and the new pack are left
+        self.assertEqual(sorted(os.listdir(self.directory)), ["thumbnails.1.pack", "thumbnails.idx"])
+
+    def test_crash_before_switching_packs(self):
+        self.fill()
+        # the new pack and index are written, but the index isn't replaced
+        with mock.patch("os.replace", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.pack.compact()
+        self.assertEqual(self.read("b.png"), [payload(42).decode()])
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(9, 300 * 1024).decode()])
+        self.assertEqual(sorted(os.listdir(self.directory)), ["thumbnails.idx", "thumbnails.pack"])
+
+    def test_crash_after_switching_packs(self):
+        self.fill()
+        old_pack = self.pack.pack_path
+        # the old pack can't be removed, as if it was still open on Windows
+        with mock.patch("os.remove", side_effect=OSError):
+            self.pack.compact()
+        self.assertTrue(osp.exists(old_pack))
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(9, 300 * 1024).decode()])
+        self.assertEqual(self.read("b.png"), [payload(42).decode()])
+        self.assertFalse(osp.exists(old_pack))
+        # and the next compaction goes on from there
+        self.fill()
+        self.pack.compact()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["thumbnails.2.pack", "thumbnails.idx"])
+        self.assertEqual(self.read("b.png"), [payload(42).decode()])
+
+    def test_truncated_index(self):
+        self.append("a.png", seed=1)
+        self.append("b.png", seed=2)
+        self.pack.close()
+        with open(self.pack.index_path, "rb+") as idx:
+            idx.truncate(osp.getsize(self.pack.index_path) - 10)
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(1).decode()])
+        self.assertEqual(self.read("b.png"), [])
+        # appending after the recovery works
+        self.append("b.png", seed=3)
+        self.reopen()
+        self.assertEqual(self.read("b.png"), [payload(3).decode()])
+
+    def test_truncated_pack(self):
+        self.append("a.png", seed=1)
+        self.append("b.png", seed=2)
+        self.pack.close()
+        with open(self.pack.pack_path, "rb+") as pack:
+            pack.truncate(osp.getsize(self.pack.pack_path) - 1)
+        self.reopen()
+        self.assertEqual(self.read("a.png"), [payload(1).decode()])
+        self.assertEqual(self.pack.entries("b.png", "1:1"), [])
+
+    def test_eviction(self):
+        self.reopen(max_size=3 * len(payload(0)))
+        for name in "abc":
+            self.append(name + ".png")
+        # read, so b.png is now the least recently used
+        self.read("a.png")
+        self.append("d.png")
+        self.assertEqual([name for name in "abcd" if self.pack.entries(name + ".png", "1:1")], ["a", "c", "d"])
+        self.reopen(max_size=3 * len(payload(0)))
+        self.assertEqual(self.pack.entries("b.png", "1:1"), [])
+        self.assertEqual(self.read("a.png"), [payload(0).decode()])
+
+    def test_eviction_keeps_the_latest_file(self):
+        self.reopen(max_size=10)
+        self.append("a.png")
+        self.append("b.png")
+        self.assertEqual(self.pack.entries("a.png", "1:1"), [])
+        self.assertEqual(self.read("b.png"), [payload(0).decode()])
+
+    def test_eviction_order_survives_compaction(self):
+        size = len(payload(0, 300 * 1024))
+        self.reopen(max_size=3 * size)
+        for name in "abc":
+            self.append(name + ".png", length=300 * 1024)
+        for _ in range(5):
+            self.append("c.png", length=300 * 1024)
+        self.read("a.png")
+        self.pack.compact()
+        self.append("d.png", length=300 * 1024)
+        self.assertEqual([name for name in "abcd" if self.pack.entries(name + ".png", "1:1")], ["a", "c", "d"])
+
+    def test_file_stamp(self):
+        path = osp.join(self.directory, "a.png")
+        with open(path, "wb") as f:
+            f.write(b'1')
+        stamp = file_stamp(path)
+        with open(path, "wb") as f:
+            f.write(b'12')
+        self.assertNotEqual(file_stamp(path), stamp)
+        os.remove(path)
+        with self.assertRaises(OSError):
+            file_stamp(path)
+
+
+if __name__ == '__main__':
+    unittest.main()